@@ -0,0 +1,270 @@
+import argparse
+import asyncio
+import csv
+import io
+import logging
+import sys
+from datetime import datetime, timedelta
+
+from sqlalchemy import Integer, cast, delete, func, insert, select
+
+from database import close_db, get_session, init_db, upsert_counts
+from models import (
+    DailyCategoryStats, DailyFeedbackStats, DailyQuestionStats, Establishment, JobRun, Position, Question,
+    Suggestion, User, UserAnswer
+)
+
+logger = logging.getLogger(__name__)
+
+# Звіти читають лише щоденні підсумки (та таблицю пропозицій), а не user_answers
+REPORTS = {
+    'category': "Точність за категоріями",
+    'establishment': "Точність за закладами",
+    'position': "Точність за посадами",
+    'hardest': "Найскладніші питання",
+    'feedback': "Оцінки за закладами",
+    'suggestions': "Пропозиції",
+}
+FEEDBACK_TOPICS = {
+    'learning': "Якість навчання",
+    'menu': "Оновлення меню",
+}
+DIMENSIONS = {
+    'category': DailyCategoryStats.category,
+    'establishment': Establishment.name,
+    'position': Position.name,
+}
+# Довідник і стовпець users, через які підсумки групуються за закладом чи посадою
+_DIMENSION_LOOKUPS = {
+    'establishment': (Establishment, User.establishment_id),
+    'position': (Position, User.position_id),
+}
+# Запис job_runs з датою, до якої відповіді перенесено в архів (retention.py)
+ARCHIVE_MARKER = 'answers_archived_before'
+
+
+async def record_rollups(session, answers):
+    """Оновлення щоденних підсумків за пакетом відповідей у поточній транзакції
+
+    answers - словники з user_id, question_id, is_correct, answered_at.
+    """
+    if not answers:
+        return
+    result = await session.execute(
+        select(Question.id, Question.category).filter(Question.id.in_({a['question_id'] for a in answers}))
+    )
+    categories = dict(result.all())
+
+    by_category = {}
+    by_question = {}
+    for answer in answers:
+        day = answer['answered_at'].date()
+        correct = 1 if answer['is_correct'] else 0
+        for counts, key in (
+            (by_category, (day, answer['user_id'], categories.get(answer['question_id']) or '')),
+            (by_question, (day, answer['question_id'])),
+        ):
+            attempts, total_correct = counts.get(key, (0, 0))
+            counts[key] = (attempts + 1, total_correct + correct)
+
+    await upsert_counts(session, DailyCategoryStats, ['day', 'user_id', 'category'], by_category)
+    await upsert_counts(session, DailyQuestionStats, ['day', 'question_id'], by_question)
+
+
+async def archived_before(session):
+    """Дата, раніше якої відповіді перенесено з user_answers в архів (None - архіву немає)"""
+    result = await session.execute(select(JobRun.run_date).filter(JobRun.job_id == ARCHIVE_MARKER))
+    return result.scalar_one_or_none()
+
+
+async def rebuild_rollups():
+    """Перерахунок підсумків з user_answers (для бази, що існувала до аналітики)
+
+    Підсумки днів, відповіді яких уже перенесено в архів, не чіпаються.
+    """
+    day = func.date(UserAnswer.answered_at)
+    correct = func.sum(cast(UserAnswer.is_correct, Integer))
+    category = func.coalesce(Question.category, '')
+    async for session in get_session():
+        since = await archived_before(session)
+        clear_categories = delete(DailyCategoryStats)
+        clear_questions = delete(DailyQuestionStats)
+        answers = []
+        if since:
+            clear_categories = clear_categories.filter(DailyCategoryStats.day >= since)
+            clear_questions = clear_questions.filter(DailyQuestionStats.day >= since)
+            answers.append(UserAnswer.answered_at >= datetime.combine(since, datetime.min.time()))
+        await session.execute(clear_categories)
+        await session.execute(clear_questions)
+        await session.execute(insert(DailyCategoryStats).from_select(
+            ['day', 'user_id', 'category', 'attempts', 'correct'],
+            select(day, UserAnswer.user_id, category, func.count(), correct)
+            .select_from(UserAnswer)
+            .outerjoin(Question, Question.id == UserAnswer.question_id)
+            .filter(UserAnswer.user_id.isnot(None), UserAnswer.question_id.isnot(None), *answers)
+            .group_by(day, UserAnswer.user_id, category)
+        ))
+        await session.execute(insert(DailyQuestionStats).from_select(
+            ['day', 'question_id', 'attempts', 'correct'],
+            select(day, UserAnswer.question_id, func.count(), correct)
+            .filter(UserAnswer.question_id.isnot(None), *answers)
+            .group_by(day, UserAnswer.question_id)
+        ))
+        await session.commit()
+
+
+def _accuracy(attempts, correct):
+    return round(100 * (correct or 0) / attempts, 1) if attempts else 0.0
+
+
+def _since(days):
+    return datetime.utcnow().date() - timedelta(days=days - 1) if days else None
+
+
+async def accuracy_report(dimension, days=None):
+    """Точність відповідей за категорією, закладом або посадою за останні days днів"""
+    column = DIMENSIONS[dimension]
+    attempts = func.sum(DailyCategoryStats.attempts)
+    correct = func.sum(DailyCategoryStats.correct)
+    query = select(column, attempts, correct).group_by(column).order_by(column)
+    if dimension in _DIMENSION_LOOKUPS:
+        lookup, foreign_key = _DIMENSION_LOOKUPS[dimension]
+        query = (
+            query.join(User, User.id == DailyCategoryStats.user_id)
+            .outerjoin(lookup, lookup.id == foreign_key)
+            .group_by(foreign_key)
+        )
+    if days:
+        query = query.filter(DailyCategoryStats.day >= _since(days))
+
+    async for session in get_session():
+        result = await session.execute(query)
+        rows = [
+            (name or '—', attempts, correct or 0, _accuracy(attempts, correct))
+            for name, attempts, correct in result
+        ]
+    return ('Назва', 'Відповідей', 'Правильних', 'Точність, %'), rows
+
+
+async def hardest_questions(days=None, min_attempts=5, limit=20):
+    """Питання з найнижчою часткою правильних відповідей"""
+    attempts = func.sum(DailyQuestionStats.attempts)
+    correct = func.sum(DailyQuestionStats.correct)
+    query = (
+        select(DailyQuestionStats.question_id, Question.category, Question.text, attempts, correct)
+        .join(Question, Question.id == DailyQuestionStats.question_id)
+        .group_by(DailyQuestionStats.question_id, Question.category, Question.text)
+        .having(attempts >= min_attempts)
+        .order_by((func.coalesce(correct, 0) * 1.0 / attempts).asc(), attempts.desc())
+        .limit(limit)
+    )
+    if days:
+        query = query.filter(DailyQuestionStats.day >= _since(days))
+
+    async for session in get_session():
+        result = await session.execute(query)
+        rows = [
+            (question_id, category, text, attempts, correct or 0, _accuracy(attempts, correct))
+            for question_id, category, text, attempts, correct in result
+        ]
+    return ('ID', 'Категорія', 'Питання', 'Відповідей', 'Правильних', 'Точність, %'), rows
+
+
+async def feedback_report(days=None):
+    """Кількість і середня оцінка за закладами та темами за останні days днів"""
+    ratings = func.sum(DailyFeedbackStats.ratings)
+    score_sum = func.sum(DailyFeedbackStats.score_sum)
+    query = (
+        select(Establishment.name, DailyFeedbackStats.topic, ratings, score_sum)
+        .outerjoin(Establishment, Establishment.id == DailyFeedbackStats.establishment_id)
+        .group_by(DailyFeedbackStats.establishment_id, Establishment.name, DailyFeedbackStats.topic)
+        .order_by(Establishment.name, DailyFeedbackStats.topic)
+    )
+    if days:
+        query = query.filter(DailyFeedbackStats.day >= _since(days))
+
+    async for session in get_session():
+        result = await session.execute(query)
+        rows = [
+            (establishment or '—', FEEDBACK_TOPICS.get(topic, topic), ratings, round(score_sum / ratings, 2))
+            for establishment, topic, ratings, score_sum in result if ratings
+        ]
+    return ('Заклад', 'Тема', 'Оцінок', 'Середня оцінка'), rows
+
+
+async def suggestions_report(days=None):
+    """Пропозиції щодо покращення, найновіші першими"""
+    query = (
+        select(Suggestion.created_at, User.full_name, Establishment.name, Suggestion.text)
+        .outerjoin(User, User.id == Suggestion.user_id)
+        .outerjoin(Establishment, Establishment.id == User.establishment_id)
+        .order_by(Suggestion.created_at.desc())
+    )
+    if days:
+        query = query.filter(Suggestion.created_at >= datetime.combine(_since(days), datetime.min.time()))
+
+    async for session in get_session():
+        result = await session.execute(query)
+        rows = [
+            (f"{created_at:%Y-%m-%d %H:%M}", full_name or '—', establishment or '—', text)
+            for created_at, full_name, establishment, text in result
+        ]
+    return ('Дата', 'Користувач', 'Заклад', 'Пропозиція'), rows
+
+
+async def build_report(name, days=None):
+    """Заголовки та рядки звіту name (ключ REPORTS)"""
+    if name == 'hardest':
+        return await hardest_questions(days)
+    if name == 'feedback':
+        return await feedback_report(days)
+    if name == 'suggestions':
+        return await suggestions_report(days)
+    return await accuracy_report(name, days)
+
+
+def report_csv(headers, rows):
+    """CSV звіту в UTF-8 з BOM, щоб Excel коректно показував кирилицю"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(headers)
+    writer.writerows(rows)
+    return buffer.getvalue().encode('utf-8-sig')
+
+
+async def _run(args):
+    await init_db()
+    try:
+        if args.command == 'rebuild':
+            await rebuild_rollups()
+            print("Підсумки аналітики перераховано з user_answers")
+            return
+        data = report_csv(*await build_report(args.report, args.days))
+        if args.output:
+            with open(args.output, 'wb') as f:
+                f.write(data)
+            print(f"Звіт «{REPORTS[args.report]}» збережено у {args.output}")
+        else:
+            sys.stdout.write(data.decode('utf-8-sig'))
+    finally:
+        await close_db()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Аналітика відповідей: звіти у CSV")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    report_parser = subparsers.add_parser('report', help="експорт звіту")
+    report_parser.add_argument('report', choices=list(REPORTS))
+    report_parser.add_argument('--days', type=int, help="лише останні N днів")
+    report_parser.add_argument('-o', '--output', help="файл CSV (за замовчуванням - stdout)")
+
+    subparsers.add_parser('rebuild', help="перерахунок підсумків з user_answers")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(_run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+from datetime import datetime, time, timezone
+
+from apscheduler.util import astimezone
+from sqlalchemy import bindparam, insert, select, update
+
+import config
+from analytics import record_rollups
+from buffered_writer import BufferedWriter
+from database import get_session
+from metrics import registry
+from models import User, UserAnswer
+from spaced_repetition import record_answers
+from user_cache import user_cache
+
+# Компактний код відповіді замість callback_data: джерело * 100 + номер варіанта + 1.
+# У щоденних питаннях варіант 0 - правильна відповідь, у грі - позиція у перемішаному
+# списку сесії; код джерело * 100 означає, що відповіді немає
+DAILY, GAME = 0, 1
+ANSWER_SOURCES = {'answer': DAILY, 'game': GAME}
+
+
+def answer_code(source, option):
+    return source * 100 + max(option, -1) + 1
+
+
+def decode_answer(code):
+    """Пара (джерело, варіант) за кодом; варіант -1 - відповіді немає"""
+    source, option = divmod(code, 100)
+    return source, option - 1
+
+
+def local_today():
+    """Поточна дата за поясом TIMEZONE - доба щоденного рахунку (обнулюється о локальній півночі)"""
+    return datetime.now(astimezone(config.TIMEZONE)).date()
+
+
+def day_start(day):
+    """Початок доби day за поясом TIMEZONE в UTC без поясу, як UserAnswer.answered_at"""
+    local = astimezone(config.TIMEZONE).localize(datetime.combine(day, time()))
+    return local.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def parse_answer(data):
+    """Код відповіді за рядком callback_data старого формату ('answer_<id>_<варіант>', 'game_<id>_<варіант>')"""
+    parts = (data or '').split('_')
+    source = ANSWER_SOURCES.get(parts[0], DAILY)
+    if len(parts) < 3 or parts[2] == 'correct':
+        return answer_code(source, 0)
+    try:
+        return answer_code(source, int(parts[2]))
+    except ValueError:
+        return answer_code(source, -1)
+
+
+class AnswerWriter(BufferedWriter):
+    """Відкладений пакетний запис відповідей та приростів рахунку
+
+    Прирости рахунку агрегуються по користувачу в один UPDATE total_score = total_score + ?,
+    а стан повторення та щоденні підсумки аналітики оновлюються в тій самій транзакції.
+    """
+
+    description = "відповідей"
+
+    def __init__(self, flush_interval=0.2, max_items=500):
+        super().__init__(flush_interval, max_items)
+        self._answers = []
+        self._scores = {}
+        self._telegram_ids = set()
+        # Щоденні питання, на які вже відповіли сьогодні: пари (user_id, question_id)
+        self._answered_day = None
+        self._answered = set()
+
+    def __len__(self):
+        return len(self._answers)
+
+    async def first_answer(self, user_id, question_id):
+        """Чи це перша за добу відповідь користувача на щоденне питання
+
+        Пара позначається до запиту до бази, тому з кількох одночасних натискань
+        зараховується лише одне, і знімається, якщо запит не вдався; після перезапуску
+        відповіді доби шукаються в базі.
+        """
+        today = local_today()
+        if self._answered_day != today:
+            self._answered_day = today
+            self._answered = set()
+        key = (user_id, question_id)
+        if key in self._answered:
+            return False
+        self._answered.add(key)
+        try:
+            async for session in get_session():
+                result = await session.execute(
+                    select(UserAnswer.id)
+                    .filter(
+                        UserAnswer.user_id == user_id,
+                        UserAnswer.answered_at >= day_start(today),
+                        UserAnswer.question_id == question_id,
+                        UserAnswer.answer_code < GAME * 100
+                    )
+                    .limit(1)
+                )
+                answered = result.first() is not None
+        except BaseException:
+            # Перевірка не відбулася (помилка чи скасування): повторне натискання має перевірятися знову, а не відхилятися
+            self._answered.discard(key)
+            raise
+        return not answered
+
+    def submit(self, user, question_id, answer_code, is_correct, points=0):
+        """Постановка відповіді (answer_code - див. answer_code()) в чергу на запис"""
+        self._answers.append({
+            'user_id': user.id,
+            'question_id': question_id,
+            'answer_code': answer_code,
+            'is_correct': is_correct,
+            'answered_at': datetime.utcnow(),
+        })
+        if points:
+            self.add_score(user, points)
+        self._added()
+
+    def add_score(self, user, points):
+        """Приріст щоденного та загального рахунку користувача"""
+        self._scores[user.id] = self._scores.get(user.id, 0) + points
+        self._telegram_ids.add(user.telegram_id)
+
+    def _take(self):
+        if not self._answers and not self._scores:
+            return None
+        batch = (self._answers, self._scores, self._telegram_ids)
+        self._answers, self._scores, self._telegram_ids = [], {}, set()
+        return batch
+
+    async def _write(self, session, batch):
+        answers, scores, _ = batch
+        if answers:
+            await session.execute(insert(UserAnswer), answers)
+            await record_answers(session, answers)
+            await record_rollups(session, answers)
+        if scores:
+            await session.execute(
+                update(User)
+                .where(User.id == bindparam('uid'))
+                .values(
+                    daily_score=User.daily_score + bindparam('points'),
+                    total_score=User.total_score + bindparam('points')
+                )
+                .execution_options(synchronize_session=False),
+                [{'uid': user_id, 'points': points} for user_id, points in scores.items()]
+            )
+
+    def _written(self, batch):
+        for telegram_id in batch[2]:
+            user_cache.invalidate(telegram_id)
+
+
+answer_writer = AnswerWriter(
+    flush_interval=config.ANSWER_FLUSH_INTERVAL / 1000,
+    max_items=config.ANSWER_FLUSH_SIZE
+)
+registry.gauge('quizkm_answer_buffer_size', "Відповіді в буфері, ще не записані в базу", func=answer_writer.__len__)
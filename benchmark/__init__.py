@@ -0,0 +1,6 @@
+"""Офлайн навантажувальний тест бота: python -m benchmark
+
+Локальна заміна Telegram Bot API (fake_bot_api) з затримкою та відповідями 429,
+синтетичні користувачі, питання й оновлення (synthetic) та сценарії реєстрації,
+відповідей, статистики, ігор і щоденної розсилки через обробники з main.py (runner).
+"""
@@ -0,0 +1,93 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+SCENARIOS = ('registration', 'answers', 'stats', 'games', 'broadcast')
+FIELDS = ('operations', 'elapsed', 'throughput', 'p50_ms', 'p99_ms')
+
+
+def _delta(value, base):
+    if not base:
+        return 'n/a'
+    return f"{(value - base) / base * 100:+.1f}%"
+
+
+def report(results, baseline=None):
+    """Таблиця результатів; з baseline - зміна пропускної здатності та p99 у відсотках"""
+    lines = [f"{'сценарій':<14}{'операцій':>10}{'оп/с':>11}{'p50, мс':>10}{'p99, мс':>10}  примітки"]
+    for name, data in results.items():
+        notes = ', '.join(f"{k}={v}" for k, v in data.items() if k not in FIELDS)
+        base = (baseline or {}).get(name)
+        if base:
+            notes = (
+                f"оп/с {_delta(data['throughput'], base['throughput'])}, "
+                f"p99 {_delta(data['p99_ms'], base['p99_ms'])}" + (f"; {notes}" if notes else '')
+            )
+        lines.append(
+            f"{name:<14}{data['operations']:>10}{data['throughput']:>11.1f}"
+            f"{data['p50_ms']:>10.1f}{data['p99_ms']:>10.1f}  {notes}"
+        )
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmark',
+        description="Навантажувальний тест обробників бота з локальною заміною Telegram Bot API"
+    )
+    parser.add_argument('scenarios', nargs='*', help=f"сценарії: {', '.join(SCENARIOS)} (за замовчуванням - усі)")
+    parser.add_argument('--users', type=int, default=2000, help="зареєстровані користувачі")
+    parser.add_argument('--questions', type=int, default=500)
+    parser.add_argument('--registrations', type=int, default=200, help="нові реєстрації")
+    parser.add_argument('--answers', type=int, default=5000, help="натискання варіантів відповіді")
+    parser.add_argument('--stats', type=int, default=2000, help="запити статистики")
+    parser.add_argument('--games', type=int, default=300, help="завершені ігри")
+    parser.add_argument('--concurrency', type=int, default=64, help="одночасно оброблювані оновлення")
+    parser.add_argument('--latency', type=float, default=0.03, help="затримка Bot API, с")
+    parser.add_argument('--jitter', type=float, default=0.01, help="розкид затримки Bot API, с")
+    parser.add_argument('--flood-rate', type=float, default=0.001, help="частка sendMessage з 429 під час розсилки")
+    parser.add_argument('--retry-after', type=float, default=1, help="retry_after у відповіді 429, с")
+    parser.add_argument('--broadcast-rate', type=float, default=1000,
+                        help="ліміт розсилки, повідомлень/с (у боті - BROADCAST_RATE)")
+    parser.add_argument('--chat-interval', type=float, default=0,
+                        help="інтервал між повідомленнями в чат, с (у боті - BROADCAST_CHAT_INTERVAL)")
+    parser.add_argument('--database-url', help="порожня база (за замовчуванням - тимчасовий файл SQLite)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('-o', '--output', help="зберегти результати у JSON (базова лінія для --baseline)")
+    parser.add_argument('--baseline', help="JSON попереднього запуску для порівняння")
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"невідомі сценарії: {', '.join(sorted(unknown))}")
+    args.scenarios = args.scenarios or list(SCENARIOS)
+
+    # Налаштування читаються під час імпорту модулів бота, тому задаються до нього
+    workdir = tempfile.mkdtemp(prefix='quizkm-bench-')
+    os.environ['DATABASE_URL'] = args.database_url or f"sqlite+aiosqlite:///{workdir}/bench.db"
+    os.environ['TELEGRAM_TOKEN'] = '123456:benchmark'
+    os.environ['BROADCAST_RATE'] = str(args.broadcast_rate)
+    os.environ['BROADCAST_CHAT_INTERVAL'] = str(args.chat_interval)
+    os.environ['DB_ECHO'] = '0'
+    from .runner import run
+
+    results = asyncio.run(run(args))
+    data = {
+        'params': {k: v for k, v in vars(args).items() if k not in ('output', 'baseline', 'database_url')},
+        'results': {result.name: result.as_dict() for result in results}
+    }
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+    print(report(data['results'], baseline))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        print(f"Результати збережено у {args.output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
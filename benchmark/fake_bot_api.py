@@ -0,0 +1,101 @@
+import asyncio
+import json
+import random
+import time
+
+from aiohttp import web
+
+BOT_ID = 1
+
+
+class SentMessage:
+    __slots__ = ('chat_id', 'text', 'reply_markup', 'sent_at')
+
+    def __init__(self, chat_id, text, reply_markup, sent_at):
+        self.chat_id = chat_id
+        self.text = text
+        self.reply_markup = reply_markup
+        self.sent_at = sent_at
+
+
+class FakeBotAPI:
+    """Локальна заміна Telegram Bot API для навантажувального тесту
+
+    Відповідає на виклики бота з затримкою latency ± jitter секунд і записує
+    кожне sendMessage. З ймовірністю flood_rate sendMessage отримує 429
+    з retry_after, як при перевищенні лімітів Telegram.
+    """
+
+    def __init__(self, latency=0.03, jitter=0.01, flood_rate=0.0, retry_after=1, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.messages = []
+        self.calls = {}
+        self.floods = 0
+        self._message_id = 0
+        self._runner = None
+        self.url = None
+
+    def reset(self):
+        self.messages.clear()
+        self.calls.clear()
+        self.floods = 0
+
+    async def start(self, host='127.0.0.1', port=0):
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        # Бот додає до base_url токен і назву методу
+        self.url = f'http://{host}:{port}/bot'
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request):
+        method = request.match_info['method']
+        params = dict(await request.post())
+        self.calls[method] = self.calls.get(method, 0) + 1
+        delay = self.latency + self.rng.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        if method == 'sendMessage':
+            if self.flood_rate and self.rng.random() < self.flood_rate:
+                self.floods += 1
+                return web.json_response({
+                    'ok': False,
+                    'error_code': 429,
+                    'description': f'Too Many Requests: retry after {self.retry_after}',
+                    'parameters': {'retry_after': self.retry_after}
+                }, status=429)
+            return self._ok(self._send_message(params))
+        if method == 'getMe':
+            return self._ok({'id': BOT_ID, 'is_bot': True, 'first_name': 'QuizKM', 'username': 'quizkm_bench_bot'})
+        return self._ok(True)
+
+    def _send_message(self, params):
+        chat_id = int(params['chat_id'])
+        reply_markup = json.loads(params['reply_markup']) if 'reply_markup' in params else None
+        self.messages.append(SentMessage(chat_id, params.get('text', ''), reply_markup, time.monotonic()))
+        self._message_id += 1
+        return {
+            'message_id': self._message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': BOT_ID, 'is_bot': True, 'first_name': 'QuizKM'},
+            'text': params.get('text', '')
+        }
+
+    @staticmethod
+    def _ok(result):
+        return web.json_response({'ok': True, 'result': result})
@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from urllib.parse import parse_qs, urlparse
+
+from sqlalchemy import select
+from telegram import Update
+from telegram.ext import Application
+
+from answer_writer import answer_writer
+from database import close_db, get_session, init_db
+from distractors import refresh_distractors
+from knowledge_base import knowledge_base
+from leaderboard import leaderboard
+from main import register_handlers, send_daily_questions
+from models import Question
+from persistence import SQLPersistence
+from question_store import question_store
+from user_directory import backfill_directory
+
+from . import synthetic
+from .fake_bot_api import FakeBotAPI
+
+# main.py вмикає логування рівня INFO, а httpx пише в нього кожен запит
+logging.getLogger().setLevel(logging.WARNING)
+logging.getLogger('httpx').setLevel(logging.WARNING)
+
+
+def percentile(values, q):
+    """Квантиль q відсортованого списку (найближчий ранг)"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, round(q * len(values)) - 1))]
+
+
+class Result:
+    """Підсумок сценарію: кількість операцій, тривалість та затримки в секундах"""
+
+    def __init__(self, name, operations, elapsed, latencies, **extra):
+        self.name = name
+        self.operations = operations
+        self.elapsed = elapsed
+        self.latencies = sorted(latencies)
+        self.extra = extra
+
+    def as_dict(self):
+        return {
+            'operations': self.operations,
+            'elapsed': round(self.elapsed, 4),
+            'throughput': round(self.operations / self.elapsed, 2) if self.elapsed else 0.0,
+            'p50_ms': round(percentile(self.latencies, 0.5) * 1000, 2),
+            'p99_ms': round(percentile(self.latencies, 0.99) * 1000, 2),
+            **self.extra
+        }
+
+
+async def process_streams(application, streams, concurrency):
+    """Обробка потоків оновлень: оновлення одного потоку йдуть послідовно, потоки - паралельно"""
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(stream):
+        async with semaphore:
+            for data in stream:
+                started = time.perf_counter()
+                await application.process_update(Update.de_json(data, application.bot))
+                latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run(stream) for stream in streams))
+    return latencies, time.perf_counter() - started
+
+
+def game_token(api, chat_id):
+    """Токен ігрової сесії з кнопки WebApp в останньому повідомленні чату"""
+    for message in reversed(api.messages):
+        if message.chat_id != chat_id or not message.reply_markup:
+            continue
+        for row in message.reply_markup.get('keyboard', []):
+            for button in row:
+                url = button.get('web_app', {}).get('url')
+                if url:
+                    return parse_qs(urlparse(url).query)['session'][0]
+    return None
+
+
+class Benchmark:
+    """Синтетична база, бот з обробниками з main.py та сценарії навантаження"""
+
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.api = FakeBotAPI(args.latency, args.jitter, retry_after=args.retry_after, seed=args.seed)
+        self.factory = synthetic.UpdateFactory()
+        self.application = None
+        self.telegram_ids = []
+        self.question_ids = []
+
+    async def setup(self):
+        base_url = await self.api.start()
+        await init_db()
+        self.telegram_ids = await synthetic.seed(self.args.users, self.args.questions, self.rng)
+        async for session in get_session():
+            self.question_ids = list((await session.execute(select(Question.id))).scalars())
+            await backfill_directory(session)
+        await refresh_distractors()
+        await question_store.load()
+        await leaderboard.load()
+        await knowledge_base.init()
+
+        self.application = (
+            Application.builder().token(os.environ['TELEGRAM_TOKEN']).base_url(base_url)
+            .persistence(SQLPersistence()).build()
+        )
+        register_handlers(self.application)
+        await self.application.initialize()
+        answer_writer.start()
+
+    async def teardown(self):
+        if self.application is not None:
+            await self.application.shutdown()
+        await answer_writer.stop()
+        await close_db()
+        await self.api.stop()
+
+    async def _process(self, streams):
+        return await process_streams(self.application, streams, self.args.concurrency)
+
+    async def registration(self):
+        first = synthetic.FIRST_TELEGRAM_ID + self.args.users
+        latencies, elapsed = await self._process(
+            synthetic.registration(self.factory, first + i, self.rng) for i in range(self.args.registrations)
+        )
+        return Result('registration', len(latencies), elapsed, latencies)
+
+    async def answers(self):
+        updates = synthetic.answers(self.factory, self.telegram_ids, self.question_ids, self.args.answers, self.rng)
+        latencies, elapsed = await self._process([update] for update in updates)
+        # Відповіді записуються у фоні, тому окремо міряємо час до повного запису в базу
+        started = time.perf_counter()
+        await answer_writer.flush()
+        drain = time.perf_counter() - started
+        return Result('answers', len(latencies), elapsed + drain, latencies, drain_ms=round(drain * 1000, 2))
+
+    async def stats(self):
+        latencies, elapsed = await self._process(
+            [self.factory.text(self.rng.choice(self.telegram_ids), "📊 Статистика")] for _ in range(self.args.stats)
+        )
+        return Result('stats', len(latencies), elapsed, latencies)
+
+    async def games(self):
+        players = self.rng.sample(self.telegram_ids, min(self.args.games, len(self.telegram_ids)))
+        await self._process([self.factory.text(player, "🎮 Почати гру")] for player in players)
+        latencies, elapsed = await self._process(
+            [synthetic.game_result(self.factory, player, game_token(self.api, player), self.rng)]
+            for player in players
+        )
+        return Result('games', len(latencies), elapsed, latencies)
+
+    async def broadcast(self):
+        """Щоденна розсилка всім користувачам; затримка - час до останнього питання в чаті"""
+        self.api.reset()
+        self.api.flood_rate = self.args.flood_rate
+        started = time.monotonic()
+        try:
+            await send_daily_questions(self.application.bot)
+        finally:
+            self.api.flood_rate = 0.0
+        elapsed = time.monotonic() - started
+        delivered = {}
+        for message in self.api.messages:
+            delivered[message.chat_id] = message.sent_at - started
+        return Result(
+            'broadcast', len(self.api.messages), elapsed, list(delivered.values()),
+            chats=len(delivered), floods=self.api.floods
+        )
+
+
+async def run(args):
+    """Виконання вибраних сценаріїв по черзі; повертає список Result"""
+    benchmark = Benchmark(args)
+    results = []
+    try:
+        await benchmark.setup()
+        for scenario in args.scenarios:
+            results.append(await getattr(benchmark, scenario)())
+    finally:
+        await benchmark.teardown()
+    return results
@@ -0,0 +1,125 @@
+import json
+import time
+import itertools
+
+from sqlalchemy import insert
+
+from database import get_session
+from models import User
+from question_bank import import_questions
+
+from .fake_bot_api import BOT_ID
+
+CATEGORIES = ['Безпека', 'Сервіс', 'Кухня', 'Бар', 'Каса', 'Гігієна', 'Обладнання', 'Меню']
+ESTABLISHMENTS = ['Київ, Поділ', 'Київ, Оболонь', 'Львів, Центр', 'Одеса, Аркадія', 'Дніпро, Набережна']
+POSITIONS = ['Офіціант', 'Бармен', 'Кухар', 'Касир', 'Адміністратор']
+FIRST_TELEGRAM_ID = 100_000_000
+BOT = {'id': BOT_ID, 'is_bot': True, 'first_name': 'QuizKM'}
+
+
+def question_rows(total, rng):
+    """Рядки для question_bank.import_questions"""
+    for i in range(1, total + 1):
+        category = CATEGORIES[i % len(CATEGORIES)]
+        yield i, {
+            'category': category,
+            'text': f"[{category} #{i}] Яка дія правильна в ситуації {rng.randint(1, 10 ** 6)}?",
+            'correct_answer': f"Відповідь {i}",
+            'explanation': f"Пояснення до питання {i}: так передбачає стандарт закладу."
+        }
+
+
+async def seed(users, questions, rng):
+    """Заповнення порожньої бази синтетичними питаннями та користувачами; повертає telegram_id користувачів"""
+    await import_questions(question_rows(questions, rng))
+    telegram_ids = [FIRST_TELEGRAM_ID + i for i in range(users)]
+    rows = [
+        {
+            'telegram_id': telegram_id,
+            'full_name': f"Користувач {telegram_id}",
+            'city': rng.choice(ESTABLISHMENTS),
+            'position': rng.choice(POSITIONS),
+            'daily_score': 0,
+            'total_score': 0
+        }
+        for telegram_id in telegram_ids
+    ]
+    async for session in get_session():
+        await session.execute(insert(User), rows)
+        await session.commit()
+    return telegram_ids
+
+
+class UpdateFactory:
+    """Сирі оновлення Telegram (dict) від імені користувачів"""
+
+    def __init__(self):
+        self._update_id = itertools.count(1)
+        self._message_id = itertools.count(1)
+
+    @staticmethod
+    def _user(telegram_id):
+        return {'id': telegram_id, 'is_bot': False, 'first_name': f"U{telegram_id}", 'language_code': 'uk'}
+
+    def _message(self, telegram_id, sender=None, **fields):
+        message = {
+            'message_id': next(self._message_id),
+            'date': int(time.time()),
+            'chat': {'id': telegram_id, 'type': 'private'},
+            'from': sender or self._user(telegram_id)
+        }
+        message.update(fields)
+        return message
+
+    def text(self, telegram_id, text):
+        fields = {'text': text}
+        if text.startswith('/'):
+            command = text.split()[0]
+            fields['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+        return {'update_id': next(self._update_id), 'message': self._message(telegram_id, **fields)}
+
+    def callback(self, telegram_id, data):
+        return {
+            'update_id': next(self._update_id),
+            'callback_query': {
+                'id': str(next(self._update_id)),
+                'from': self._user(telegram_id),
+                'chat_instance': str(telegram_id),
+                'data': data,
+                # Повідомлення бота з питанням, під яким натиснуто кнопку
+                'message': self._message(telegram_id, sender=BOT, text="Питання")
+            }
+        }
+
+    def web_app_data(self, telegram_id, data):
+        return {
+            'update_id': next(self._update_id),
+            'message': self._message(telegram_id, web_app_data={
+                'data': json.dumps(data),
+                'button_text': "🎮 Почати гру"
+            })
+        }
+
+
+def registration(factory, telegram_id, rng):
+    """Повна реєстрація: /start, ім'я, прізвище, посада, заклад"""
+    return [
+        factory.text(telegram_id, '/start'),
+        factory.text(telegram_id, f"Ім'я{telegram_id}"),
+        factory.text(telegram_id, f"Прізвище{telegram_id}"),
+        factory.text(telegram_id, rng.choice(POSITIONS)),
+        factory.text(telegram_id, rng.choice(ESTABLISHMENTS))
+    ]
+
+
+def answers(factory, telegram_ids, question_ids, total, rng, correct_rate=0.7):
+    """Натискання варіантів відповіді (варіант 0 - правильний)"""
+    for _ in range(total):
+        option = 0 if rng.random() < correct_rate else rng.randint(1, 3)
+        yield factory.callback(rng.choice(telegram_ids), f'answer_{rng.choice(question_ids)}_{option}')
+
+
+def game_result(factory, telegram_id, token, rng, questions=10, options=4):
+    """Результат гри з випадковими відповідями на питання сесії"""
+    answers_ = [rng.randrange(options) for _ in range(questions)]
+    return factory.web_app_data(telegram_id, {'type': 'game_complete', 'session': token, 'answers': answers_})
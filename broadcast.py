@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+import config
+from metrics import broadcast_messages, broadcast_queue_depth, broadcast_retries, telegram_retry_after
+
+logger = logging.getLogger(__name__)
+
+# Ліміти Telegram Bot API: ~30 повідомлень/с глобально та ~1 повідомлення/с в один чат.
+# Беремо з запасом, щоб ніколи не впиратися у flood control.
+GLOBAL_RATE = config.BROADCAST_RATE
+PER_CHAT_INTERVAL = config.BROADCAST_CHAT_INTERVAL
+WORKERS = config.BROADCAST_WORKERS
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+
+class TokenBucket:
+    """Асинхронний token bucket: rate токенів на секунду, не більше capacity"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """Очікування вільного токена"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class ChatThrottle:
+    """Мінімальний інтервал між повідомленнями в один чат"""
+
+    def __init__(self, interval, max_chats=10000):
+        self.interval = interval
+        self.max_chats = max_chats
+        self._next = OrderedDict()
+
+    async def wait(self, chat_id):
+        now = time.monotonic()
+        ready_at = self._next.get(chat_id, now)
+        self._next[chat_id] = max(ready_at, now) + self.interval
+        self._next.move_to_end(chat_id)
+        while len(self._next) > self.max_chats:
+            self._next.popitem(last=False)
+        if ready_at > now:
+            await asyncio.sleep(ready_at - now)
+
+
+class BroadcastStats:
+    """Підсумки розсилки"""
+
+    def __init__(self):
+        self.chats = 0
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def __str__(self):
+        return (
+            f"чатів: {self.chats}, надіслано: {self.sent}, помилок: {self.failed}, "
+            f"повторів: {self.retries}, час: {self.elapsed:.1f} с"
+        )
+
+
+class Broadcaster:
+    """Відправка повідомлень пулом воркерів з дотриманням лімітів Telegram"""
+
+    def __init__(self, rate=GLOBAL_RATE, chat_interval=PER_CHAT_INTERVAL, workers=WORKERS,
+                 max_retries=MAX_RETRIES):
+        self.bucket = TokenBucket(rate)
+        self.throttle = ChatThrottle(chat_interval)
+        self.workers = workers
+        self.max_retries = max_retries
+        self._paused_until = 0.0
+
+    async def _wait_pause(self):
+        # Після 429 Telegram блокує бота цілком, тому чекають усі воркери
+        delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def send_message(self, bot, chat_id, stats=None, **kwargs):
+        """Відправка одного повідомлення з повторами; повертає True при успіху"""
+        for attempt in range(self.max_retries + 1):
+            await self._wait_pause()
+            await self.throttle.wait(chat_id)
+            await self.bucket.acquire()
+            try:
+                await bot.send_message(chat_id=chat_id, **kwargs)
+                broadcast_messages.labels('sent').inc()
+                if stats:
+                    stats.sent += 1
+                return True
+            except RetryAfter as e:
+                telegram_retry_after.inc()
+                retry_after = float(e.retry_after)
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+                logger.warning(f"Flood control для чату {chat_id}, очікування {retry_after} с")
+            except (Forbidden, BadRequest) as e:
+                # Користувач заблокував бота або чат не існує - повтор не допоможе
+                logger.info(f"Не вдалося надіслати повідомлення в чат {chat_id}: {e}")
+                break
+            except (TimedOut, NetworkError) as e:
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+                logger.warning(f"Мережева помилка для чату {chat_id}: {e}, повтор через {delay} с")
+                await asyncio.sleep(delay)
+            if attempt < self.max_retries:
+                broadcast_retries.inc()
+                if stats:
+                    stats.retries += 1
+        broadcast_messages.labels('failed').inc()
+        if stats:
+            stats.failed += 1
+        return False
+
+    async def send_messages(self, bot, chat_id, messages, stats=None):
+        """Послідовна відправка кількох повідомлень в один чат"""
+        for message in messages:
+            if not await self.send_message(bot, chat_id, stats, **message):
+                # Решту повідомлень не надсилаємо, щоб не ламати нумерацію питань
+                break
+
+    async def _worker(self, bot, queue, stats):
+        while True:
+            job = await queue.get()
+            broadcast_queue_depth.set(queue.qsize())
+            try:
+                if job is None:
+                    return
+                chat_id, messages = job
+                await self.send_messages(bot, chat_id, messages, stats)
+            except Exception as e:
+                logger.error(f"Помилка при розсилці: {e}")
+            finally:
+                queue.task_done()
+
+    async def run(self, bot, jobs):
+        """Розсилка: jobs - асинхронний ітератор пар (chat_id, [kwargs для send_message])"""
+        stats = BroadcastStats()
+        queue = asyncio.Queue(maxsize=self.workers * 2)
+        workers = [asyncio.create_task(self._worker(bot, queue, stats)) for _ in range(self.workers)]
+        try:
+            async for job in jobs:
+                stats.chats += 1
+                await queue.put(job)
+                broadcast_queue_depth.set(queue.qsize())
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+        return stats
+
+
+broadcaster = Broadcaster()
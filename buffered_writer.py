@@ -0,0 +1,148 @@
+import abc
+import asyncio
+import logging
+
+from sqlalchemy.exc import DBAPIError, OperationalError
+
+from database import engine, get_session
+
+logger = logging.getLogger(__name__)
+
+
+def _is_transient(error):
+    """Помилка, після якої той самий пакет варто просто повторити
+
+    Це блокування SQLite («database is locked»/«busy») та втрата з'єднання
+    з сервером БД; решта помилок (обмеження, схема, дані) повториться знову.
+    """
+    if isinstance(error, DBAPIError) and error.connection_invalidated:
+        return True
+    if not isinstance(error, OperationalError):
+        return False
+    if engine.dialect.name != 'sqlite':
+        return True
+    message = str(error.orig).lower()
+    return 'locked' in message or 'busy' in message
+
+
+class BufferedWriter(abc.ABC):
+    """Основа відкладеного пакетного запису
+
+    Обробники лише додають дані в буфер у пам'яті, а фонова задача записує
+    накопичене однією транзакцією кожні flush_interval секунд або одразу після
+    max_items записів. Пакет з помилкою повторюється окремо від нових даних:
+    при тимчасовій помилці (блокування БД) - без обмеження, інакше він
+    відкидається після max_attempts спроб і його вміст пишеться в журнал,
+    щоб один некоректний рядок не блокував подальший запис.
+    Підкласи реалізують __len__, _take та _write.
+    """
+
+    # Що записується - для повідомлення про помилку («Помилка при записі ...»)
+    description = "даних"
+    max_attempts = 5
+
+    def __init__(self, flush_interval, max_items):
+        self.flush_interval = flush_interval
+        self.max_items = max_items
+        # Примітиви asyncio створюються на циклі подій бота, а не під час імпорту
+        self._wakeup = None
+        self._flush_lock = None
+        self._task = None
+        self._stopping = False
+        # Пакети, запис яких не вдався: пари (пакет, кількість нетимчасових помилок)
+        self._failed = []
+
+    @abc.abstractmethod
+    def __len__(self):
+        """Кількість записів у буфері"""
+
+    def _added(self):
+        """Виклик після додавання в буфер: при переповненні запис починається одразу"""
+        if len(self) >= self.max_items and self._wakeup:
+            self._wakeup.set()
+
+    @abc.abstractmethod
+    def _take(self):
+        """Забрати вміст буфера для запису (None - записувати нічого)"""
+
+    @abc.abstractmethod
+    async def _write(self, session, batch):
+        """Запис batch у поточній транзакції (коміт робить flush)"""
+
+    def _written(self, batch):
+        """Дії після успішного коміту (наприклад, скидання кешів)"""
+
+    async def _flush_batch(self, batch, attempt):
+        """Запис одного пакету; True - успішно"""
+        try:
+            async for session in get_session():
+                await self._write(session, batch)
+                await session.commit()
+        except Exception as e:
+            if _is_transient(e):
+                # Блокування минає саме: пакет чекає наступного запису, спроба не рахується
+                logger.warning(f"Тимчасова помилка при записі {self.description}: {e}")
+                self._failed.append((batch, attempt - 1))
+            elif attempt < self.max_attempts:
+                # Зберігаємо пакет до наступної спроби, нові дані пишуться окремо
+                logger.error(f"Помилка при записі {self.description} (спроба {attempt}): {e}")
+                self._failed.append((batch, attempt))
+            else:
+                # Вміст пакету лишається в журналі, щоб його можна було відновити вручну
+                logger.error(
+                    f"Пакет {self.description} відкинуто після {attempt} спроб: {e}; "
+                    f"вміст пакету: {batch!r}"
+                )
+            return False
+        self._written(batch)
+        return True
+
+    async def flush(self):
+        """Запис накопичених даних однією транзакцією (і повтор пакету з попередньою помилкою)
+
+        Кидає RuntimeError, якщо якийсь пакет записати не вдалося.
+        """
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            written = True
+            failed, self._failed = self._failed, []
+            for batch, attempt in failed:
+                written = await self._flush_batch(batch, attempt + 1) and written
+            batch = self._take()
+            if batch is not None:
+                written = await self._flush_batch(batch, 1) and written
+        if not written:
+            raise RuntimeError(f"Помилка при записі {self.description}")
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                await asyncio.sleep(self.flush_interval)
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Зупинка фонового запису з гарантованим збереженням залишку"""
+        if self._task is not None:
+            # Не скасовуємо задачу посеред транзакції, а чекаємо завершення поточного запису
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            # Помилка запису не повинна переривати решту зупинки бота
+            logger.error(f"Залишок {self.description} не збережено при зупинці: {e}")
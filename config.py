@@ -0,0 +1,83 @@
+import os
+from dotenv import load_dotenv
+
+# Завантаження змінних середовища
+load_dotenv()
+
+TOKEN = os.getenv('TELEGRAM_TOKEN')
+# Telegram ID адміністраторів через кому (звіти та службові команди)
+ADMIN_IDS = {int(i) for i in os.getenv('ADMIN_IDS', '').split(',') if i.strip()}
+
+# Налаштування бази даних
+DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite+aiosqlite:///quiz.db')
+DB_ECHO = os.getenv('DB_ECHO', '0').lower() in ('1', 'true', 'yes')
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+DB_BUSY_TIMEOUT = int(os.getenv('DB_BUSY_TIMEOUT', 5000))
+
+# Розклад щоденних задач
+TIMEZONE = os.getenv('TIMEZONE', 'Europe/Kyiv')
+ESTABLISHMENT_TIMEZONES = os.getenv('ESTABLISHMENT_TIMEZONES', '')
+DAILY_QUESTION_HOUR = int(os.getenv('DAILY_QUESTION_HOUR', 12))
+DAILY_QUESTION_MINUTE = int(os.getenv('DAILY_QUESTION_MINUTE', 0))
+DAILY_SEND_WINDOW = int(os.getenv('DAILY_SEND_WINDOW', 60))
+DAILY_SEND_SLOTS = int(os.getenv('DAILY_SEND_SLOTS', 6))
+SCHEDULER_MISFIRE_GRACE = int(os.getenv('SCHEDULER_MISFIRE_GRACE', 14400))
+
+# Нічне архівування історії відповідей у боті (ANSWER_RETENTION_DAYS=0 - вимкнено, за замовчуванням)
+ANSWER_RETENTION_DAYS = int(os.getenv('ANSWER_RETENTION_DAYS', 0))
+ANSWER_ARCHIVE_DIR = os.getenv('ANSWER_ARCHIVE_DIR', 'archive')
+RETENTION_HOUR = int(os.getenv('RETENTION_HOUR', 4))
+VACUUM_FREE_RATIO = float(os.getenv('VACUUM_FREE_RATIO', 0.2))
+
+# Збереження стану розмов (PERSISTENCE_SHARED - перечитувати стан розмов, змінений іншим процесом з тією ж базою;
+# сесії гри, рейтинг і кеш користувачів залишаються в пам'яті одного процесу)
+PERSISTENCE_INTERVAL = float(os.getenv('PERSISTENCE_INTERVAL', 1))
+PERSISTENCE_SHARED = os.getenv('PERSISTENCE_SHARED', '0').lower() in ('1', 'true', 'yes')
+
+# Налаштування розсилки
+BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', 25))
+BROADCAST_CHAT_INTERVAL = float(os.getenv('BROADCAST_CHAT_INTERVAL', 1.1))
+BROADCAST_WORKERS = int(os.getenv('BROADCAST_WORKERS', 32))
+
+# Налаштування кешу користувачів
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 10000))
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', 300))
+
+# Перевірка версії банку питань для перезавантаження знімка в пам'яті (секунди)
+QUESTION_RELOAD_INTERVAL = float(os.getenv('QUESTION_RELOAD_INTERVAL', 30))
+
+# Пакетний запис відповідей
+ANSWER_FLUSH_INTERVAL = int(os.getenv('ANSWER_FLUSH_INTERVAL', 200))
+ANSWER_FLUSH_SIZE = int(os.getenv('ANSWER_FLUSH_SIZE', 500))
+
+# Пакетний запис оцінок і пропозицій
+FEEDBACK_FLUSH_INTERVAL = int(os.getenv('FEEDBACK_FLUSH_INTERVAL', 1000))
+FEEDBACK_FLUSH_SIZE = int(os.getenv('FEEDBACK_FLUSH_SIZE', 200))
+
+# HTML5 гра та HTTP-сервер
+GAME_URL = os.getenv('GAME_URL', 'https://kultup.github.io/QuizKM/index.html')
+GAME_API_URL = os.getenv('GAME_API_URL', 'http://localhost:8080')
+GAME_SESSION_TTL = int(os.getenv('GAME_SESSION_TTL', 1800))
+WEB_HOST = os.getenv('WEB_HOST', '0.0.0.0')
+WEB_PORT = int(os.getenv('WEB_PORT', 8080))
+WEB_ALLOW_ORIGIN = os.getenv('WEB_ALLOW_ORIGIN', '*')
+# Токен для /metrics та /debug/profiler (заголовок Authorization: Bearer); без нього ці адреси вимкнені
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Режим роботи бота: polling або webhook
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', 40))
+UPDATE_WORKERS = int(os.getenv('UPDATE_WORKERS', 8))
+UPDATE_QUEUE_SIZE = int(os.getenv('UPDATE_QUEUE_SIZE', 1000))
+SHUTDOWN_TIMEOUT = float(os.getenv('SHUTDOWN_TIMEOUT', 30))
+
+# Пошук у базі знань
+KB_PAGE_SIZE = int(os.getenv('KB_PAGE_SIZE', 5))
+KB_MAX_RESULTS = int(os.getenv('KB_MAX_RESULTS', 50))
+KB_CACHE_SIZE = int(os.getenv('KB_CACHE_SIZE', 512))
+KB_CACHE_TTL = float(os.getenv('KB_CACHE_TTL', 600))
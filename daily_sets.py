@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import random
+
+from sqlalchemy import select
+
+from answer_writer import local_today
+from database import dialect_insert, get_session
+from models import DailyQuestion, Question, User
+from spaced_repetition import due_questions, scheduled_questions
+
+logger = logging.getLogger(__name__)
+
+DAILY_SET_SIZE = 5
+PAGE_SIZE = 500
+# Нових питань-кандидатів на кожне вільне місце в наборі: частина може бути ще запланована до повторення
+CANDIDATES_PER_SLOT = 3
+CANDIDATE_ROUNDS = 3
+
+_generated_day = None
+_generate_lock = None
+
+
+async def load_category_index():
+    """Ідентифікатори питань, згруповані за категоріями"""
+    async for session in get_session():
+        result = await session.execute(select(Question.id, Question.category))
+        rows = result.all()
+
+    by_category = {}
+    for question_id, category in rows:
+        by_category.setdefault(category, []).append(question_id)
+    return by_category
+
+
+def pick_balanced(by_category, size, rng=random, exclude=()):
+    """Вибір size питань з рівномірним розподілом по категоріях
+
+    З категорії береться не більше size питань, тому замість перемішування всього пулу
+    вибирається випадкова підмножина розміром size + len(exclude): вартість не залежить
+    від кількості питань у банку.
+    """
+    if size <= 0:
+        return []
+    categories = list(by_category)
+    rng.shuffle(categories)
+    pools = {}
+    for category in categories:
+        pool = by_category[category]
+        sample = rng.sample(pool, min(len(pool), size + len(exclude)))
+        pools[category] = [q for q in sample if q not in exclude][:size] if exclude else sample
+
+    picked = []
+    while len(picked) < size and categories:
+        for category in list(categories):
+            if len(picked) >= size:
+                break
+            if pools[category]:
+                picked.append(pools[category].pop())
+            else:
+                categories.remove(category)
+    return picked
+
+
+async def _insert_sets(session, rows):
+    """Запис наборів без помилки на вже існуючих: набір того самого дня могла щойно створити
+    паралельна розсилка (інший слот чи процес) або повторне натискання"""
+    statement = dialect_insert(DailyQuestion).on_conflict_do_nothing(index_elements=['day', 'user_id', 'position'])
+    result = await session.execute(statement, rows)
+    await session.commit()
+    # Кількість справді вставлених рядків (без пропущених через конфлікт)
+    return result.rowcount
+
+
+async def _existing_users(session, day, first_id, last_id):
+    result = await session.execute(
+        select(DailyQuestion.user_id.distinct())
+        .filter(DailyQuestion.day == day, DailyQuestion.user_id.between(first_id, last_id))
+    )
+    return set(result.scalars())
+
+
+async def _plan_sets(session, user_ids, day, by_category, size):
+    """Рядки наборів: спершу питання, повторення яких настало, далі нові з балансом категорій"""
+    first_id, last_id = min(user_ids), max(user_ids)
+    due = await due_questions(session, first_id, last_id, day, size)
+    sets = {user_id: list(due.get(user_id, [])) for user_id in user_ids}
+    checked = {user_id: set(picked) for user_id, picked in sets.items()}
+    for _ in range(CANDIDATE_ROUNDS):
+        # Кандидати вже впорядковані з балансом категорій; з них відкидаються заплановані на майбутнє
+        candidates = {}
+        for user_id, picked in sets.items():
+            if len(picked) < size:
+                question_ids = pick_balanced(
+                    by_category, (size - len(picked)) * CANDIDATES_PER_SLOT, exclude=checked[user_id]
+                )
+                if question_ids:
+                    candidates[user_id] = question_ids
+                # Сторінка з сотень користувачів не повинна блокувати обробку оновлень
+                await asyncio.sleep(0)
+        if not candidates:
+            break
+        scheduled = await scheduled_questions(session, candidates, day)
+        for user_id, question_ids in candidates.items():
+            checked[user_id].update(question_ids)
+            excluded = scheduled.get(user_id, set())
+            sets[user_id] += [q for q in question_ids if q not in excluded][:size - len(sets[user_id])]
+
+    rows = []
+    for user_id in user_ids:
+        picked = sets[user_id]
+        if len(picked) < size:
+            # Майже всі кандидати ще заплановані на майбутнє - беремо будь-які інші
+            picked += pick_balanced(by_category, size - len(picked), exclude=set(picked))
+        rows.extend(
+            {'day': day, 'user_id': user_id, 'position': position, 'question_id': question_id}
+            for position, question_id in enumerate(picked)
+        )
+    return rows
+
+
+async def generate_daily_sets(day=None, size=DAILY_SET_SIZE, by_category=None):
+    """Генерація наборів питань на день для всіх користувачів, у яких їх ще немає;
+    повертає кількість записаних рядків (питань у наборах)
+
+    Кожен набір починається з питань, які користувачу час повторити (за станом
+    інтервального повторення), решта - нові питання з балансом категорій.
+    """
+    day = day or local_today()
+    if by_category is None:
+        by_category = await load_category_index()
+    if not by_category:
+        return 0
+
+    created = 0
+    last_id = 0
+    while True:
+        async for session in get_session():
+            result = await session.execute(
+                select(User.id).filter(User.id > last_id).order_by(User.id).limit(PAGE_SIZE)
+            )
+            user_ids = result.scalars().all()
+            if user_ids:
+                existing = await _existing_users(session, day, user_ids[0], user_ids[-1])
+                pending = [user_id for user_id in user_ids if user_id not in existing]
+                rows = await _plan_sets(session, pending, day, by_category, size) if pending else []
+                if rows:
+                    created += await _insert_sets(session, rows)
+        if not user_ids:
+            break
+        last_id = user_ids[-1]
+
+    logger.info(f"Записано питань у щоденні набори на {day}: {created}")
+    return created
+
+
+async def ensure_daily_sets(day=None, by_category=None):
+    """Генерація наборів дня один раз на процес: перший слот розсилки створює набори
+    всім користувачам, наступні слоти (і наздоганяння після перезапуску) лише читають їх"""
+    global _generated_day, _generate_lock
+    day = day or local_today()
+    if _generate_lock is None:
+        _generate_lock = asyncio.Lock()
+    async with _generate_lock:
+        if _generated_day == day:
+            return
+        if by_category is None:
+            by_category = await load_category_index()
+        if by_category:
+            await generate_daily_sets(day, by_category=by_category)
+            _generated_day = day
+
+
+async def get_daily_set(user_id, day=None, size=DAILY_SET_SIZE, by_category=None):
+    """Ідентифікатори питань користувача на день; набір створюється, якщо його ще немає
+
+    by_category - індекс питань за категоріями (question_store.category_index()); без нього
+    індекс читається з бази до відкриття сесії, щоб не тримати два з'єднання пулу одночасно.
+    """
+    day = day or local_today()
+    query = (
+        select(DailyQuestion.question_id)
+        .filter(DailyQuestion.day == day, DailyQuestion.user_id == user_id)
+        .order_by(DailyQuestion.position)
+    )
+    async for session in get_session():
+        question_ids = (await session.execute(query)).scalars().all()
+    if question_ids:
+        return question_ids
+
+    # Користувач зареєструвався після генерації наборів (або розсилка ще не почалася)
+    if by_category is None:
+        by_category = await load_category_index()
+    async for session in get_session():
+        rows = await _plan_sets(session, [user_id], day, by_category, size)
+        if rows:
+            await _insert_sets(session, rows)
+            # Паралельний запит міг записати свій набір першим - повертаємо той, що в базі
+            question_ids = (await session.execute(query)).scalars().all()
+    return question_ids
+
+
+async def iter_daily_sets(day=None, page_size=PAGE_SIZE, size=DAILY_SET_SIZE, criteria=()):
+    """Посторінкове читання наборів дня: пари (telegram_id, [question_id, ...])
+
+    criteria - додаткові умови на User (заклад, слот розсилки тощо).
+    """
+    day = day or local_today()
+    last_user_id = 0
+    limit = page_size * size
+    while True:
+        async for session in get_session():
+            result = await session.execute(
+                select(DailyQuestion.user_id, User.telegram_id, DailyQuestion.question_id)
+                .join(User, User.id == DailyQuestion.user_id)
+                .filter(DailyQuestion.day == day, DailyQuestion.user_id > last_user_id, *criteria)
+                .order_by(DailyQuestion.user_id, DailyQuestion.position)
+                .limit(limit)
+            )
+            rows = result.all()
+        if not rows:
+            return
+
+        sets = {}
+        for user_id, telegram_id, question_id in rows:
+            sets.setdefault((user_id, telegram_id), []).append(question_id)
+
+        # Набір останнього користувача може бути обрізаний лімітом - дочитаємо його наступною сторінкою
+        if len(rows) == limit and len(sets) > 1:
+            sets.pop(next(reversed(sets)))
+
+        for (user_id, telegram_id), question_ids in sets.items():
+            yield telegram_id, question_ids
+            last_user_id = user_id
+
@@ -0,0 +1,66 @@
+import abc
+import asyncio
+import logging
+
+from sqlalchemy import select
+
+from database import upsert_counts
+from models import DataVersion
+
+logger = logging.getLogger(__name__)
+
+# Ключі лічильників data_versions
+QUESTIONS = 'questions'
+KNOWLEDGE = 'knowledge'
+# Збільшується після синхронізації співробітників (user_directory)
+USERS = 'users'
+
+
+async def get_version(session, key=QUESTIONS):
+    result = await session.execute(select(DataVersion.version).filter(DataVersion.key == key))
+    return result.scalar_one_or_none() or 0
+
+
+async def bump_version(session, key=QUESTIONS):
+    """Збільшення лічильника змін key у поточній транзакції (після імпорту чи редагування даних)"""
+    await upsert_counts(session, DataVersion, ['key'], {(key,): (1,)}, columns=('version',))
+
+
+class VersionWatcher(abc.ABC):
+    """Основа кешів, що скидаються за лічильниками data_versions
+
+    Фонова задача раз на interval секунд викликає check(), яка порівнює лічильники
+    з тими, за якими заповнено кеш, і перезавантажує його, якщо імпорт (у будь-якому
+    процесі) їх збільшив.
+    """
+
+    # Що перевіряється - для повідомлення про помилку («Помилка при перевірці версії ...»)
+    description = "даних"
+
+    def __init__(self):
+        self._task = None
+
+    @abc.abstractmethod
+    async def check(self):
+        """Перезавантаження кешу, якщо версія даних у базі змінилася; True - кеш оновлено"""
+
+    async def _watch(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.check()
+            except Exception as e:
+                logger.error(f"Помилка при перевірці версії {self.description}: {e}")
+
+    def start(self, interval=30):
+        if self._task is None:
+            self._task = asyncio.create_task(self._watch(interval))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
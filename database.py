@@ -1,16 +1,149 @@
+import asyncio
+
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+import config
+from metrics import instrument_engine
 from models import Base
 
-DATABASE_URL = "sqlite+aiosqlite:///quiz.db"
+DATABASE_URL = config.DATABASE_URL
+# Значень в одному IN (...) або пакеті ключів: SQLite до версії 3.32 приймає не більше 999 параметрів на запит
+IN_BATCH_SIZE = 500
+
+
+def _engine_options(url):
+    """Параметри рушія залежно від типу бази даних"""
+    options = {'echo': config.DB_ECHO}
+    if url.get_backend_name() == 'sqlite':
+        if url.database and url.database != ':memory:':
+            # За замовчуванням aiosqlite відкриває нове з'єднання (і потік) на кожну сесію
+            options.update(
+                poolclass=AsyncAdaptedQueuePool,
+                pool_size=config.DB_POOL_SIZE,
+                max_overflow=0,
+            )
+        options['connect_args'] = {'timeout': config.DB_BUSY_TIMEOUT / 1000}
+    else:
+        options.update(
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_recycle=config.DB_POOL_RECYCLE,
+            pool_pre_ping=True,
+        )
+    return options
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL дозволяє читати паралельно із записом, а synchronous=NORMAL
+    # прибирає fsync на кожен коміт (безпечно в режимі WAL)
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={config.DB_BUSY_TIMEOUT}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+def create_engine(url=DATABASE_URL):
+    url = make_url(url)
+    engine = create_async_engine(url, **_engine_options(url))
+    if url.get_backend_name() == 'sqlite':
+        event.listen(engine.sync_engine, 'connect', _set_sqlite_pragmas)
+    instrument_engine(engine.sync_engine)
+    return engine
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+
+engine = create_engine()
 async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
+_UPSERT_INSERTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+
+def dialect_insert(model):
+    """INSERT діалекту бази з підтримкою ON CONFLICT (SQLite та PostgreSQL)"""
+    insert = _UPSERT_INSERTS.get(engine.dialect.name)
+    if insert is None:
+        raise ValueError(
+            f"INSERT ... ON CONFLICT не підтримується для бази {engine.dialect.name}, "
+            f"потрібна одна з: {', '.join(_UPSERT_INSERTS)}"
+        )
+    return insert(model)
+
+
+async def upsert_counts(session, model, keys, counts, columns=('attempts', 'correct')):
+    """Додавання лічильників columns до наявних рядків: INSERT ... ON CONFLICT DO UPDATE
+
+    counts - словник {значення ключів: значення лічильників} у порядку keys та columns.
+    """
+    if not counts:
+        return
+    statement = dialect_insert(model)
+    statement = statement.on_conflict_do_update(
+        index_elements=keys,
+        set_={column: getattr(model, column) + getattr(statement.excluded, column) for column in columns}
+    )
+    await session.execute(statement, [
+        {**dict(zip(keys, key)), **dict(zip(columns, values))}
+        for key, values in counts.items()
+    ])
+
+
+def _add_missing_columns(connection):
+    """Додавання нових (nullable) стовпців до вже існуючих таблиць; повертає кількість доданих"""
+    inspector = inspect(connection)
+    added = 0
+    for table in Base.metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(connection.dialect)
+                connection.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+                added += 1
+    return added
+
+
+def _migrate(connection):
+    """Доповнення існуючої бази: нові таблиці створює create_all, а стовпці
+    та індекси для вже існуючих таблиць додаються тут
+
+    ANALYZE виконується лише після зміни схеми: статистика потрібна планувальнику
+    для нових індексів, а повний прохід по таблицях при кожному запуску бота зайвий.
+    """
+    changed = _add_missing_columns(connection)
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(connection)
+                changed += 1
+    if changed and connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql("ANALYZE")
+
+
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_migrate)
+    # З'єднання пулу прив'язані до циклу подій, а бот запускається на новому циклі
+    # (asyncio.run закриває цей): драйвери на кшталт asyncpg не працюють зі старими з'єднаннями
+    await engine.dispose()
+
+
+async def close_db():
+    await engine.dispose()
+
 
 async def get_session():
     async with async_session() as session:
-        yield session 
\ No newline at end of file
+        yield session
+
+
+if __name__ == '__main__':
+    # Створення відсутніх таблиць та індексів в існуючій базі
+    asyncio.run(init_db())
+    print(f"Міграцію бази даних {DATABASE_URL} завершено")
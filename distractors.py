@@ -0,0 +1,126 @@
+import logging
+import random
+from bisect import bisect_left
+
+from sqlalchemy import delete, insert, select
+
+from database import IN_BATCH_SIZE, get_session
+from models import Question, QuestionDistractor
+
+logger = logging.getLogger(__name__)
+
+DISTRACTORS_PER_QUESTION = 3
+# Кандидати, найближчі за довжиною до правильної відповіді, виглядають правдоподібніше
+CANDIDATE_POOL = 6
+
+
+class Candidates:
+    """Унікальні відповіді, впорядковані за довжиною: найближчі до заданої
+    довжини знаходяться бінарним пошуком, без сортування на кожне питання"""
+
+    def __init__(self, answers):
+        self.answers = sorted({a for a in answers if a}, key=lambda a: (len(a), a))
+        self.lengths = [len(a) for a in self.answers]
+
+    def nearest(self, answer, limit, exclude=()):
+        """До limit відповідей, найближчих за довжиною до answer, крім exclude"""
+        target = len(answer)
+        lo = bisect_left(self.lengths, target) - 1
+        hi = lo + 1
+        found = []
+        while len(found) < limit and (lo >= 0 or hi < len(self.answers)):
+            if hi >= len(self.answers) or (lo >= 0 and target - self.lengths[lo] <= self.lengths[hi] - target):
+                candidate = self.answers[lo]
+                lo -= 1
+            else:
+                candidate = self.answers[hi]
+                hi += 1
+            if candidate not in exclude:
+                found.append(candidate)
+        return found
+
+
+def choose_distractors(correct_answer, same_category, other, count=DISTRACTORS_PER_QUESTION, rng=random):
+    """Вибір неправильних варіантів: спершу з тієї ж категорії, потім з інших"""
+    chosen = []
+    seen = {correct_answer}
+    for candidates in (same_category, other):
+        if not isinstance(candidates, Candidates):
+            candidates = Candidates(candidates)
+        pool = candidates.nearest(correct_answer, max(CANDIDATE_POOL, count), seen)
+        rng.shuffle(pool)
+        for candidate in pool[:count - len(chosen)]:
+            chosen.append(candidate)
+            seen.add(candidate)
+        if len(chosen) >= count:
+            break
+    return chosen
+
+
+async def refresh_distractors(question_ids=None, count=DISTRACTORS_PER_QUESTION):
+    """Перерахунок варіантів для вказаних питань та питань, яким їх бракує
+
+    Перераховуються лише категорії, яких стосуються зміни, тому виклик після
+    додавання питань не чіпає решту бази.
+    """
+    async for session in get_session():
+        result = await session.execute(select(Question.id, Question.category, Question.correct_answer))
+        questions = result.all()
+
+        result = await session.execute(select(QuestionDistractor.question_id, QuestionDistractor.position))
+        filled = {}
+        for question_id, _ in result:
+            filled[question_id] = filled.get(question_id, 0) + 1
+
+        by_category = {}
+        for question in questions:
+            by_category.setdefault(question.category, []).append(question.correct_answer)
+        by_category = {category: Candidates(answers) for category, answers in by_category.items()}
+        all_answers = Candidates(q.correct_answer for q in questions)
+
+        targets = set(question_ids or [])
+        # Нові питання (або питання з неповним набором) розширюють вибір для своєї
+        # категорії, тому перераховується вся категорія, а не вся база
+        changed = {q.category for q in questions if q.id in targets or filled.get(q.id, 0) < count}
+        targets.update(q.id for q in questions if q.category in changed)
+        if not targets:
+            return 0
+
+        rows = []
+        for question in questions:
+            if question.id not in targets:
+                continue
+            same_category = by_category[question.category]
+            options = choose_distractors(question.correct_answer, same_category, all_answers, count)
+            rows.extend(
+                {'question_id': question.id, 'position': position, 'text': text}
+                for position, text in enumerate(options)
+            )
+
+        target_list = list(targets)
+        for start in range(0, len(target_list), IN_BATCH_SIZE):
+            await session.execute(delete(QuestionDistractor).filter(
+                QuestionDistractor.question_id.in_(target_list[start:start + IN_BATCH_SIZE])
+            ))
+        if rows:
+            await session.execute(insert(QuestionDistractor), rows)
+        await session.commit()
+
+    logger.info(f"Оновлено варіанти відповідей для {len(targets)} питань")
+    return len(targets)
+
+
+async def get_distractors(question_ids=None):
+    """Неправильні варіанти за питаннями одним індексованим запитом: {question_id: [текст, ...]}"""
+    query = select(QuestionDistractor.question_id, QuestionDistractor.text).order_by(
+        QuestionDistractor.question_id, QuestionDistractor.position
+    )
+    if question_ids is not None:
+        query = query.filter(QuestionDistractor.question_id.in_(list(question_ids)))
+
+    distractors = {}
+    async for session in get_session():
+        result = await session.execute(query)
+        for question_id, text in result:
+            distractors.setdefault(question_id, []).append(text)
+    return distractors
@@ -0,0 +1,92 @@
+from datetime import datetime
+
+from sqlalchemy import insert
+
+import config
+from analytics import FEEDBACK_TOPICS
+from buffered_writer import BufferedWriter
+from database import upsert_counts
+from metrics import registry
+from models import DailyFeedbackStats, FeedbackRating, Suggestion
+
+MIN_SCORE, MAX_SCORE = 1, 5
+MAX_SUGGESTION_LENGTH = 4000
+
+
+async def record_feedback_rollups(session, ratings):
+    """Оновлення щоденних підсумків оцінок за закладами у поточній транзакції
+
+    ratings - словники з topic, score, created_at та establishment_id (заклад на момент оцінки).
+    """
+    counts = {}
+    for rating in ratings:
+        key = (rating['created_at'].date(), rating['topic'], rating['establishment_id'] or 0)
+        total, score_sum = counts.get(key, (0, 0))
+        counts[key] = (total + 1, score_sum + rating['score'])
+    await upsert_counts(
+        session, DailyFeedbackStats, ['day', 'topic', 'establishment_id'], counts, columns=('ratings', 'score_sum')
+    )
+
+
+class FeedbackWriter(BufferedWriter):
+    """Відкладений пакетний запис оцінок і пропозицій
+
+    Після розсилки про оновлення меню оцінки приходять сплесками, тому записи
+    і оновлення щоденних підсумків виконуються однією транзакцією на пакет.
+    """
+
+    description = "зворотного зв'язку"
+
+    def __init__(self, flush_interval=1.0, max_items=200):
+        super().__init__(flush_interval, max_items)
+        self._ratings = []
+        self._suggestions = []
+
+    def __len__(self):
+        return len(self._ratings) + len(self._suggestions)
+
+    def submit_rating(self, user, topic, score):
+        """Постановка оцінки score (1-5) за темою topic у чергу на запис"""
+        if topic not in FEEDBACK_TOPICS or not MIN_SCORE <= score <= MAX_SCORE:
+            raise ValueError(f"Некоректна оцінка: {topic} {score}")
+        self._ratings.append({
+            'user_id': user.id,
+            'topic': topic,
+            'score': score,
+            'created_at': datetime.utcnow(),
+            'establishment_id': user.establishment_id,
+        })
+        self._added()
+
+    def submit_suggestion(self, user, text):
+        """Постановка пропозиції у чергу на запис (user - None для незареєстрованих)"""
+        self._suggestions.append({
+            'user_id': user.id if user else None,
+            'text': text[:MAX_SUGGESTION_LENGTH],
+            'created_at': datetime.utcnow(),
+        })
+        self._added()
+
+    def _take(self):
+        if not self._ratings and not self._suggestions:
+            return None
+        batch = (self._ratings, self._suggestions)
+        self._ratings, self._suggestions = [], []
+        return batch
+
+    async def _write(self, session, batch):
+        ratings, suggestions = batch
+        if ratings:
+            await session.execute(insert(FeedbackRating), [
+                {k: v for k, v in rating.items() if k != 'establishment_id'} for rating in ratings
+            ])
+            await record_feedback_rollups(session, ratings)
+        if suggestions:
+            await session.execute(insert(Suggestion), suggestions)
+
+
+feedback_writer = FeedbackWriter(
+    flush_interval=config.FEEDBACK_FLUSH_INTERVAL / 1000,
+    max_items=config.FEEDBACK_FLUSH_SIZE
+)
+registry.gauge('quizkm_feedback_buffer_size', "Оцінки та пропозиції в буфері", func=feedback_writer.__len__)
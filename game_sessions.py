@@ -0,0 +1,121 @@
+import gzip
+import json
+import random
+import secrets
+import time
+
+import config
+
+PURGE_INTERVAL = 60
+
+
+class GameSession:
+    """Видана гра: питання з правильними відповідями залишаються на сервері"""
+
+    __slots__ = ('token', 'telegram_id', 'questions', 'answers', 'expires_at', '_payload', '_payload_gz')
+
+    def __init__(self, token, telegram_id, questions, expires_at):
+        self.token = token
+        self.telegram_id = telegram_id
+        self.questions = questions
+        self.answers = {}
+        self.expires_at = expires_at
+        self._payload = None
+        self._payload_gz = None
+
+    @property
+    def payload(self):
+        """JSON для клієнта без правильних відповідей і пояснень"""
+        if self._payload is None:
+            data = {
+                'questions': [
+                    {'text': q['text'], 'options': q['options']} for q in self.questions
+                ]
+            }
+            self._payload = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        return self._payload
+
+    @property
+    def payload_gz(self):
+        if self._payload_gz is None:
+            self._payload_gz = gzip.compress(self.payload)
+        return self._payload_gz
+
+    def check(self, index, option):
+        """Перевірка відповіді; зараховується лише перша відповідь на питання"""
+        question = self.questions[index]
+        self.answers.setdefault(index, option)
+        return {
+            'correct': self.answers[index] == question['correct'],
+            'correct_option': question['correct'],
+            'explanation': question['explanation']
+        }
+
+    def final_answers(self, posted):
+        """Остаточні відповіді: перевірені під час гри мають пріоритет над надісланими
+        клієнтом; -1 означає відсутню або некоректну відповідь"""
+        if not isinstance(posted, list):
+            posted = []
+        answers = []
+        for index, question in enumerate(self.questions):
+            option = self.answers.get(index)
+            if option is None and index < len(posted):
+                option = posted[index]
+            valid = isinstance(option, int) and not isinstance(option, bool)
+            answers.append(option if valid and 0 <= option < len(question['options']) else -1)
+        return answers
+
+
+class GameSessionStore:
+    """Сховище ігрових сесій в пам'яті з часом життя ttl секунд"""
+
+    def __init__(self, ttl=1800):
+        self.ttl = ttl
+        self._sessions = {}
+        self._purged_at = time.monotonic()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def create(self, telegram_id, questions, rng=random):
+        """Нова сесія; questions - пари (Question, [варіанти відповідей])"""
+        self.purge()
+        items = []
+        for question, options in questions:
+            options = list(options)
+            rng.shuffle(options)
+            items.append({
+                'id': question.id,
+                'text': question.text,
+                'options': options,
+                'correct': options.index(question.correct_answer),
+                'explanation': question.explanation
+            })
+        token = secrets.token_urlsafe(12)
+        session = GameSession(token, telegram_id, items, time.monotonic() + self.ttl)
+        self._sessions[token] = session
+        return session
+
+    def get(self, token):
+        session = self._sessions.get(token)
+        if session is not None and session.expires_at < time.monotonic():
+            del self._sessions[token]
+            return None
+        return session
+
+    def pop(self, token):
+        session = self.get(token)
+        self._sessions.pop(token, None)
+        return session
+
+    def purge(self, force=False):
+        """Видалення прострочених сесій не частіше ніж раз на PURGE_INTERVAL секунд"""
+        now = time.monotonic()
+        if not force and now - self._purged_at < PURGE_INTERVAL:
+            return
+        self._purged_at = now
+        for token in [t for t, s in self._sessions.items() if s.expires_at < now]:
+            del self._sessions[token]
+
+
+game_sessions = GameSessionStore(ttl=config.GAME_SESSION_TTL)
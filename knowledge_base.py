@@ -0,0 +1,378 @@
+import argparse
+import asyncio
+import hashlib
+import logging
+import re
+import time
+from collections import OrderedDict
+
+from sqlalchemy import bindparam, insert, or_, select, text, update
+from sqlalchemy.exc import OperationalError
+
+import config
+from data_versions import KNOWLEDGE, QUESTIONS, VersionWatcher, bump_version, get_version
+from database import IN_BATCH_SIZE, close_db, engine, get_session, init_db
+from models import KnowledgeArticle, Question
+from question_bank import ImportStats, content_hash, read_rows, unique_by, valid_batches
+
+logger = logging.getLogger(__name__)
+
+ARTICLE_FIELDS = ('category', 'title', 'body')
+# rowid у пошуковому індексі кодує джерело: id * 2 для статей, id * 2 + 1 для питань
+ARTICLE, QUESTION = 0, 1
+MAX_TERMS = 8
+SNIPPET_TOKENS = 16
+# Закінчення, що відкидаються з кінця слова, щоб "температура" знаходила "температурі"
+_ENDINGS = set('аяиіїуюоеєйь')
+
+_SEARCH_INDEX_DDL = (
+    "CREATE VIRTUAL TABLE knowledge_fts USING fts5("
+    "title, body, category UNINDEXED, tokenize='unicode61 remove_diacritics 2')",
+    "INSERT INTO knowledge_fts(rowid, title, body, category) "
+    "SELECT id * 2, title, coalesce(body, ''), category FROM knowledge_articles",
+    "INSERT INTO knowledge_fts(rowid, title, body, category) "
+    "SELECT id * 2 + 1, text, coalesce(correct_answer, '') || ' ' || coalesce(explanation, ''), category FROM questions",
+)
+
+# Тригери підтримують індекс при будь-яких змінах, зокрема з CLI імпорту в окремому процесі
+_TRIGGERS = {
+    'knowledge_articles': (
+        "new.id * 2, new.title, coalesce(new.body, ''), new.category",
+        "old.id * 2",
+    ),
+    'questions': (
+        "new.id * 2 + 1, new.text, coalesce(new.correct_answer, '') || ' ' || coalesce(new.explanation, ''), new.category",
+        "old.id * 2 + 1",
+    ),
+}
+
+
+def _trigger_ddl(table, values, old_rowid):
+    insert_row = f"INSERT INTO knowledge_fts(rowid, title, body, category) VALUES ({values});"
+    delete_row = f"DELETE FROM knowledge_fts WHERE rowid = {old_rowid};"
+    return (
+        f"CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN {insert_row} END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN {delete_row} END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE ON {table} BEGIN {delete_row} {insert_row} END",
+    )
+
+
+def create_search_index(connection, rebuild=False):
+    """Створення (або перебудова) FTS5-індексу статей і пояснень до питань; False, якщо FTS5 недоступний"""
+    if connection.dialect.name != 'sqlite':
+        return False
+    if rebuild:
+        connection.exec_driver_sql("DROP TABLE IF EXISTS knowledge_fts")
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'knowledge_fts'"
+    ).first()
+    try:
+        if not exists:
+            for statement in _SEARCH_INDEX_DDL:
+                connection.exec_driver_sql(statement)
+            connection.exec_driver_sql("INSERT INTO knowledge_fts(knowledge_fts) VALUES('optimize')")
+        for table, (values, old_rowid) in _TRIGGERS.items():
+            for statement in _trigger_ddl(table, values, old_rowid):
+                connection.exec_driver_sql(statement)
+    except OperationalError as e:
+        logger.warning(f"FTS5 недоступний, пошук працюватиме без індексу: {e}")
+        return False
+    return True
+
+
+def _stem(word):
+    while len(word) > 3 and word[-1] in _ENDINGS:
+        word = word[:-1]
+    return word
+
+
+def search_terms(query):
+    """Нормалізовані терміни запиту (до MAX_TERMS слів)"""
+    words = re.findall(r'\w+', query.casefold())
+    return tuple(_stem(word) for word in words[:MAX_TERMS])
+
+
+def match_expression(terms, operator=' '):
+    """Вираз MATCH з префіксним пошуком кожного терміну"""
+    return operator.join(f'"{term}"*' for term in terms)
+
+
+def category_key(category):
+    """Короткий стабільний ідентифікатор категорії для callback_data (назва може не вміститися в 64 байти)"""
+    return hashlib.sha1(category.encode('utf-8')).hexdigest()[:12]
+
+
+class SearchHit:
+    """Результат пошуку: стаття або питання з фрагментом тексту"""
+
+    __slots__ = ('kind', 'id', 'category', 'title', 'snippet')
+
+    def __init__(self, rowid, category, title, snippet):
+        self.kind = rowid % 2
+        self.id = rowid // 2
+        self.category = category
+        self.title = title
+        self.snippet = snippet
+
+    @property
+    def key(self):
+        """Короткий ідентифікатор для callback_data"""
+        return f"{'aq'[self.kind]}{self.id}"
+
+
+class KnowledgeBase(VersionWatcher):
+    """Повнотекстовий пошук по статтях і поясненнях до питань з кешем популярних запитів
+
+    Кешується повний ранжований список (до max_results), тому гортання
+    сторінок результатів не повторює запит до бази. Кеш і список категорій
+    скидаються, коли імпорт питань або статей збільшує їхні версії.
+    """
+
+    description = "бази знань"
+
+    def __init__(self, max_results=50, cache_size=512, ttl=600):
+        super().__init__()
+        self.max_results = max_results
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.fts = None
+        self._cache = OrderedDict()
+        self._categories = None
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+
+    async def init(self):
+        """Підготовка пошукового індексу при старті бота"""
+        async with engine.begin() as connection:
+            self.fts = await connection.run_sync(create_search_index)
+        self._version = await self._load_version()
+        self.clear()
+
+    def clear(self):
+        self._cache.clear()
+        self._categories = None
+
+    @staticmethod
+    async def _load_version():
+        async for session in get_session():
+            version = (await get_version(session, QUESTIONS), await get_version(session, KNOWLEDGE))
+        return version
+
+    async def check(self):
+        """Скидання кешу, якщо питання чи статті змінилися (зокрема імпортом в іншому процесі)"""
+        version = await self._load_version()
+        if version != self._version:
+            self._version = version
+            self.clear()
+            return True
+        return False
+
+    def _cached(self, key):
+        entry = self._cache.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            self.misses += 1
+            return None
+        self._cache.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def _store(self, key, hits):
+        self._cache[key] = (time.monotonic() + self.ttl, hits)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _fts_search(self, session, terms, category):
+        query = (
+            "SELECT rowid, category, title, snippet(knowledge_fts, 1, '', '', '…', :tokens) "
+            "FROM knowledge_fts WHERE knowledge_fts MATCH :match"
+            + (" AND category = :category" if category else "")
+            + " ORDER BY bm25(knowledge_fts, 10.0, 1.0) LIMIT :limit"
+        )
+        params = {'tokens': SNIPPET_TOKENS, 'category': category, 'limit': self.max_results}
+        # Спершу всі слова разом; якщо нічого не знайдено - будь-яке зі слів
+        for operator in (' ', ' OR '):
+            result = await session.execute(text(query), dict(params, match=match_expression(terms, operator)))
+            rows = result.all()
+            if rows or len(terms) == 1:
+                return rows
+        return rows
+
+    async def _like_search(self, session, terms, category):
+        """Пошук без FTS5 (інші СУБД): збіг усіх слів у заголовку або тексті"""
+        rows = []
+        sources = (
+            (ARTICLE, KnowledgeArticle, KnowledgeArticle.title, KnowledgeArticle.body),
+            (QUESTION, Question, Question.text, Question.explanation),
+        )
+        for kind, model, title, body in sources:
+            query = select(model.id, model.category, title, body).filter(
+                *(or_(title.ilike(f'%{term}%'), body.ilike(f'%{term}%')) for term in terms)
+            )
+            if category:
+                query = query.filter(model.category == category)
+            result = await session.execute(query.limit(self.max_results))
+            rows.extend(
+                (row[0] * 2 + kind, row[1], row[2], (row[3] or '')[:200]) for row in result
+            )
+        return rows[:self.max_results]
+
+    async def _list_category(self, session, category):
+        query = (
+            "SELECT rowid, category, title, substr(body, 1, 200) FROM knowledge_fts "
+            "WHERE category = :category ORDER BY rowid % 2, title LIMIT :limit"
+        )
+        result = await session.execute(text(query), {'category': category, 'limit': self.max_results})
+        return result.all()
+
+    async def search(self, query='', category=None):
+        """Ранжований список SearchHit за текстом запиту та/або категорією"""
+        terms = search_terms(query)
+        if not terms and not category:
+            return []
+        key = (terms, category)
+        hits = self._cached(key)
+        if hits is not None:
+            return hits
+
+        if self.fts is None:
+            await self.init()
+        async for session in get_session():
+            if self.fts and terms:
+                rows = await self._fts_search(session, terms, category)
+            elif self.fts:
+                rows = await self._list_category(session, category)
+            else:
+                rows = await self._like_search(session, terms, category)
+        hits = [SearchHit(*row) for row in rows]
+        self._store(key, hits)
+        return hits
+
+    async def categories(self):
+        """Відсортований список категорій статей і питань"""
+        if self._categories is None:
+            async for session in get_session():
+                result = await session.execute(
+                    select(KnowledgeArticle.category).union(select(Question.category))
+                )
+                self._categories = {category_key(c): c for c in sorted(c for c in result.scalars() if c)}
+        return list(self._categories.values())
+
+    async def category(self, key):
+        """Назва категорії за category_key або None"""
+        await self.categories()
+        return self._categories.get(key)
+
+    async def get(self, key):
+        """Повний текст статті або питання за SearchHit.key: пара (заголовок, текст)"""
+        kind, item_id = key[0], int(key[1:])
+        async for session in get_session():
+            if kind == 'a':
+                article = await session.get(KnowledgeArticle, item_id)
+                return (article.title, article.body) if article else None
+            question = await session.get(Question, item_id)
+            if question is None:
+                return None
+            body = f"Правильна відповідь: {question.correct_answer}"
+            if question.explanation:
+                body += f"\n\n{question.explanation}"
+            return question.text, body
+
+
+def validate_article(row):
+    """Перевірка рядка імпорту статей; повертає словник полів KnowledgeArticle або кидає ValueError"""
+    if not isinstance(row, dict):
+        raise ValueError("рядок не є об'єктом з полями")
+    article = {field: str(row.get(field) or '').strip() for field in ARTICLE_FIELDS}
+    missing = [field for field in ARTICLE_FIELDS if not article[field]]
+    if missing:
+        raise ValueError(f"порожні поля: {', '.join(missing)}")
+    article['content_hash'] = content_hash(article['category'], article['title'])
+    return article
+
+
+async def import_articles(rows, batch_size=IN_BATCH_SIZE):
+    """Імпорт статей (category, title, body) з оновленням наявних за content_hash"""
+    stats = ImportStats()
+
+    async for session in get_session():
+        for batch in valid_batches(rows, validate_article, stats, batch_size):
+            by_hash = unique_by(batch, 'content_hash', stats)
+            result = await session.execute(
+                select(KnowledgeArticle.id, KnowledgeArticle.content_hash, KnowledgeArticle.body)
+                .filter(KnowledgeArticle.content_hash.in_(list(by_hash)))
+            )
+            existing = {row.content_hash: row for row in result}
+
+            new = [a for h, a in by_hash.items() if h not in existing]
+            changed = [
+                dict(a, aid=existing[h].id) for h, a in by_hash.items()
+                if h in existing and existing[h].body != a['body']
+            ]
+            if new:
+                await session.execute(insert(KnowledgeArticle), new)
+            if changed:
+                await session.execute(update(KnowledgeArticle).where(KnowledgeArticle.id == bindparam('aid')), changed)
+            await session.commit()
+            stats.inserted += len(new)
+            stats.updated += len(changed)
+            stats.unchanged += len(by_hash) - len(new) - len(changed)
+
+    if stats.inserted or stats.updated:
+        # Запущені боти скинуть кеш пошуку та список категорій
+        async for session in get_session():
+            await bump_version(session, KNOWLEDGE)
+            await session.commit()
+    return stats
+
+
+knowledge_base = KnowledgeBase(
+    max_results=config.KB_MAX_RESULTS,
+    cache_size=config.KB_CACHE_SIZE,
+    ttl=config.KB_CACHE_TTL
+)
+
+
+async def _run(args):
+    await init_db()
+    try:
+        async with engine.begin() as connection:
+            fts = await connection.run_sync(create_search_index, args.command == 'reindex')
+        if args.command == 'import':
+            stats = await import_articles(read_rows(args.path, args.format))
+            print(f"Імпорт статей {args.path}: {stats}")
+            for error in stats.errors:
+                print(f"  {error}")
+        elif args.command == 'reindex':
+            async for session in get_session():
+                await bump_version(session, KNOWLEDGE)
+                await session.commit()
+            print("Пошуковий індекс перебудовано" if fts else "FTS5 недоступний для цієї бази даних")
+        else:
+            for hit in await knowledge_base.search(args.query):
+                print(f"[{hit.key}] {hit.category} / {hit.title}: {hit.snippet}")
+    finally:
+        await close_db()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="База знань: імпорт статей та пошук")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = subparsers.add_parser('import', help="імпорт статей з CSV/JSONL (category, title, body)")
+    import_parser.add_argument('path')
+    import_parser.add_argument('--format', choices=('csv', 'jsonl'))
+
+    subparsers.add_parser('reindex', help="перебудова пошукового індексу")
+
+    search_parser = subparsers.add_parser('search', help="пошук з командного рядка")
+    search_parser.add_argument('query')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(_run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+import logging
+from bisect import bisect_left
+from datetime import timedelta
+
+from sqlalchemy import case, func, select
+
+from answer_writer import answer_writer, day_start, local_today
+from database import get_session
+from models import User, UserAnswer
+
+logger = logging.getLogger(__name__)
+
+WINDOWS = ('day', 'week', 'all')
+SCOPES = ('global', 'city', 'position')
+
+
+class Ranking:
+    """Відсортований рейтинг з пошуком місця за O(log n)
+
+    Кеш сторінок скидається лише тоді, коли зміна балів зачіпає закешовані позиції,
+    тому нарахування балів гравцям поза топом не перебудовує сторінки.
+    """
+
+    def __init__(self):
+        self._scores = {}
+        # Пари (-score, user_id) у порядку зростання, тобто від найкращого результату
+        self._order = []
+        self._pages = {}
+        # Кінець найдальшої закешованої сторінки
+        self._pages_end = 0
+
+    def __len__(self):
+        return len(self._order)
+
+    def score(self, user_id):
+        return self._scores.get(user_id)
+
+    def set(self, user_id, score):
+        old = self._scores.get(user_id)
+        if old == score:
+            return
+        changed_from = len(self._order)
+        if old is not None:
+            changed_from = bisect_left(self._order, (-old, user_id))
+            del self._order[changed_from]
+        self._scores[user_id] = score
+        position = bisect_left(self._order, (-score, user_id))
+        self._order.insert(position, (-score, user_id))
+        # Позиції до min(стара, нова) не змінились
+        if min(changed_from, position) < self._pages_end:
+            self._pages.clear()
+            self._pages_end = 0
+
+    def add(self, user_id, points):
+        self.set(user_id, self._scores.get(user_id, 0) + points)
+
+    def rank(self, user_id):
+        """Місце користувача (однакові бали - однакове місце) або None"""
+        score = self._scores.get(user_id)
+        if score is None:
+            return None
+        return bisect_left(self._order, (-score,)) + 1
+
+    def top(self, limit=10, offset=0):
+        """Сторінка рейтингу: список пар (user_id, score)"""
+        key = (limit, offset)
+        page = self._pages.get(key)
+        if page is None:
+            page = [(user_id, -score) for score, user_id in self._order[offset:offset + limit]]
+            self._pages[key] = page
+            self._pages_end = max(self._pages_end, offset + limit)
+        return page
+
+
+class Leaderboard:
+    """Інкрементні рейтинги за день, тиждень та весь час
+
+    Рейтинги ведуться глобально, по закладах (User.establishment_id) та по посадах (User.position_id).
+    Денні та тижневі рейтинги обнуляються при зміні періоду за поясом TIMEZONE,
+    тобто разом з обнуленням щоденного рахунку.
+    """
+
+    def __init__(self):
+        self._rankings = {}
+        self._profiles = {}
+        self._periods = {}
+
+    @staticmethod
+    def _period_start(window, today):
+        if window == 'day':
+            return today
+        if window == 'week':
+            return today - timedelta(days=today.weekday())
+        return None
+
+    def _roll(self):
+        today = local_today()
+        for window in ('day', 'week'):
+            start = self._period_start(window, today)
+            if self._periods.get(window) != start:
+                self._periods[window] = start
+                for key in [k for k in self._rankings if k[0] == window]:
+                    del self._rankings[key]
+
+    def _scope_value(self, user_id, scope):
+        if scope == 'global':
+            return None
+        profile = self._profiles.get(user_id)
+        if profile is None:
+            return None
+        return profile[1] if scope == 'city' else profile[2]
+
+    def _ranking(self, window, scope, value):
+        key = (window, scope, value)
+        ranking = self._rankings.get(key)
+        if ranking is None:
+            ranking = self._rankings[key] = Ranking()
+        return ranking
+
+    def _user_rankings(self, window, user_id):
+        for scope in SCOPES:
+            yield self._ranking(window, scope, self._scope_value(user_id, scope))
+
+    def set_profile(self, user):
+        self._profiles[user.id] = (user.full_name, user.establishment_id, user.position_id)
+
+    def name(self, user_id):
+        profile = self._profiles.get(user_id)
+        return profile[0] if profile else str(user_id)
+
+    def add_user(self, user, total_score=0):
+        """Додавання користувача до загального рейтингу"""
+        self.set_profile(user)
+        for ranking in self._user_rankings('all', user.id):
+            ranking.set(user.id, total_score)
+
+    def add_points(self, user, points):
+        """Нарахування балів одразу в усіх вікнах та розрізах"""
+        if user.id not in self._profiles:
+            self.set_profile(user)
+        self._roll()
+        for window in WINDOWS:
+            for ranking in self._user_rankings(window, user.id):
+                ranking.add(user.id, points)
+
+    def score(self, user_id, window='all'):
+        """Бали користувача у вікні (0, якщо балів немає)"""
+        self._roll()
+        return self._ranking(window, 'global', None).score(user_id) or 0
+
+    def rank(self, user_id, window='all', scope='global'):
+        """Пара (місце, кількість учасників); місце None, якщо балів у вікні немає"""
+        self._roll()
+        ranking = self._ranking(window, scope, self._scope_value(user_id, scope))
+        return ranking.rank(user_id), len(ranking)
+
+    def top(self, limit=10, window='all', scope='global', value=None, offset=0):
+        """Сторінка рейтингу: список трійок (user_id, ім'я, бали)"""
+        self._roll()
+        ranking = self._ranking(window, scope, value)
+        return [(user_id, self.name(user_id), score) for user_id, score in ranking.top(limit, offset)]
+
+    async def load(self):
+        """Початкове заповнення: загальний рахунок з users, день і тиждень - з індексованого
+        діапазону user_answers за поточний тиждень
+
+        Буфер відповідей спершу записується в базу, щоб читання бачило вже зараховані бали.
+        Новий рейтинг будується окремо і підміняє поточний одним присвоєнням, тож під час
+        завантаження запити до рейтингу бачать попередній стан, а не частково заповнений.
+        """
+        try:
+            await answer_writer.flush()
+        except Exception as e:
+            logger.warning(f"Рейтинг завантажується без частини незаписаних відповідей: {e}")
+
+        fresh = Leaderboard()
+        fresh._roll()
+        week_start = day_start(fresh._periods['week'])
+        today_start = day_start(fresh._periods['day'])
+
+        async for session in get_session():
+            users = await session.execute(
+                select(User.id, User.full_name, User.establishment_id, User.position_id, User.total_score)
+            )
+            for row in users:
+                fresh.add_user(row, row.total_score or 0)
+
+            # Межі днів у UTC (як answered_at), а не дати UTC, щоб доба збігалася з поясом TIMEZONE
+            today_count = func.sum(case((UserAnswer.answered_at >= today_start, 1), else_=0))
+            points = await session.execute(
+                select(UserAnswer.user_id, func.count(), today_count)
+                .filter(UserAnswer.answered_at >= week_start, UserAnswer.is_correct.is_(True))
+                .group_by(UserAnswer.user_id)
+            )
+            for user_id, week_count, day_count in points:
+                if user_id not in fresh._profiles:
+                    continue
+                for ranking in fresh._user_rankings('week', user_id):
+                    ranking.add(user_id, week_count)
+                if day_count:
+                    for ranking in fresh._user_rankings('day', user_id):
+                        ranking.add(user_id, day_count)
+
+        self._rankings, self._profiles, self._periods = fresh._rankings, fresh._profiles, fresh._periods
+        logger.info(f"Рейтинг завантажено: {len(self._profiles)} користувачів")
+
+leaderboard = Leaderboard()
@@ -1,15 +1,34 @@
-import os
 import logging
 import asyncio
-from datetime import datetime, time
-from dotenv import load_dotenv
+import io
+from datetime import datetime
+from functools import partial
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo, ReplyKeyboardMarkup, KeyboardButton
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
-from database import init_db, get_session
-from models import User, Question, UserAnswer
-from sqlalchemy import select, func
-import random
+import config
+from config import TOKEN
+from database import init_db, close_db, get_session
+from broadcast import broadcaster
+from user_cache import user_cache
+from answer_writer import DAILY, GAME, answer_code, answer_writer, decode_answer, local_today, parse_answer
+from feedback import MAX_SCORE, MIN_SCORE, feedback_writer
+from leaderboard import leaderboard
+from game_sessions import game_sessions
+from web_server import create_app, start_web_server
+from webhook import run_webhook
+from persistence import SQLPersistence
+from router import Router
+from scheduler import DailyScheduler, setup_daily_jobs
+from daily_sets import ensure_daily_sets, get_daily_set, iter_daily_sets
+from distractors import refresh_distractors
+from knowledge_base import category_key, knowledge_base
+from question_store import question_store
+from question_bank import detect_format, parse_rows
+from user_directory import FIELDS as STAFF_FIELDS, DirectoryWatcher, backfill_directory, profile_fields, sync_users
+from analytics import FEEDBACK_TOPICS, REPORTS, build_report, report_csv
+from models import User
 import json
+from urllib.parse import urlencode
 
 # Налаштування логування
 logging.basicConfig(
@@ -18,36 +37,36 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Завантаження змінних середовища
-load_dotenv()
-TOKEN = os.getenv('TELEGRAM_TOKEN')
+# Кнопки головного меню
+MAIN_MENU = [
+    ["📝 Щоденний тест"],
+    ["📊 Статистика", "📚 База знань"],
+    ["🎮 Почати гру", "🏆 Рейтинг"],
+    ["💬 Зворотний зв'язок"]
+]
+
+def main_menu_markup():
+    return ReplyKeyboardMarkup(MAIN_MENU, resize_keyboard=True)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обробник команди /start"""
     # Перевіряємо чи користувач вже зареєстрований
-    async for session in get_session():
-        user = await session.execute(select(User).filter(User.telegram_id == update.effective_user.id))
-        user = user.scalar_one_or_none()
-        
-        if user:
-            # Якщо користувач вже зареєстрований, показуємо головне меню
-            keyboard = [
-                ["📝 Щоденний тест"],
-                ["📊 Статистика", "📚 База знань"],
-                ["🎮 Почати гру"]
-            ]
-            reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-            await update.message.reply_text(
-                "Вітаю! Я бот для навчання персоналу Країна Мрій. Оберіть опцію:",
-                reply_markup=reply_markup
-            )
-        else:
-            # Якщо користувач не зареєстрований, починаємо реєстрацію
-            await update.message.reply_text(
-                "Вітаю! Для початку роботи потрібно зареєструватися.\n"
-                "Будь ласка, введіть ваше ім'я:"
-            )
-            context.user_data['registration_step'] = 'name'
+    user = await user_cache.get(update.effective_user.id)
+    
+    if user:
+        # Якщо користувач вже зареєстрований, показуємо головне меню
+        reply_markup = main_menu_markup()
+        await update.message.reply_text(
+            "Вітаю! Я бот для навчання персоналу Країна Мрій. Оберіть опцію:",
+            reply_markup=reply_markup
+        )
+    else:
+        # Якщо користувач не зареєстрований, починаємо реєстрацію
+        await update.message.reply_text(
+            "Вітаю! Для початку роботи потрібно зареєструватися.\n"
+            "Будь ласка, введіть ваше ім'я:"
+        )
+        context.user_data['registration_step'] = 'name'
 
 async def handle_registration(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обробник покрокової реєстрації"""
@@ -76,22 +95,19 @@ async def handle_registration(update: Update, context: ContextTypes.DEFAULT_TYPE
             # Зберігаємо всі дані в базу
             full_name = f"{context.user_data['name']} {context.user_data['surname']}"
             async for session in get_session():
+                # Заклад і посада зводяться до записів довідників (назва закладу зберігається як місто)
                 user = User(
                     telegram_id=update.effective_user.id,
                     full_name=full_name,
-                    city=update.message.text,  # Використовуємо назву закладу як місто
-                    position=context.user_data['position']
+                    **await profile_fields(session, update.message.text, context.user_data['position'])
                 )
                 session.add(user)
                 await session.commit()
+            user_cache.invalidate(update.effective_user.id)
+            leaderboard.add_user(user)
             
             # Показуємо головне меню
-            keyboard = [
-                ["📝 Щоденний тест"],
-                ["📊 Статистика", "📚 База знань"],
-                ["🎮 Почати гру"]
-            ]
-            reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+            reply_markup = main_menu_markup()
             await update.message.reply_text(
                 "Реєстрація успішна! Тепер ви можете користуватися всіма функціями бота.",
                 reply_markup=reply_markup
@@ -105,67 +121,90 @@ async def handle_registration(update: Update, context: ContextTypes.DEFAULT_TYPE
             )
             context.user_data.clear()
 
-async def send_daily_questions():
-    """Відправка щоденних питань"""
-    async for session in get_session():
-        users = await session.execute(select(User))
-        for user in users.scalars():
-            # Отримання випадкових питань
-            questions = await session.execute(
-                select(Question).order_by(func.random()).limit(5)
-            )
-            questions = questions.scalars().all()
-            
-            # Відправка питань користувачу
-            for i, question in enumerate(questions, 1):
-                keyboard = [
-                    [InlineKeyboardButton(question.correct_answer, callback_data=f'answer_{question.id}_correct')],
-                    [InlineKeyboardButton("Показати пояснення", callback_data=f'explain_{question.id}')]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                # TODO: Відправка повідомлення користувачу через бота
-                # await context.bot.send_message(
-                #     chat_id=user.telegram_id,
-                #     text=f"Питання {i}/5:\n{question.text}",
-                #     reply_markup=reply_markup
-                # )
+def build_question_messages(questions, telegram_id):
+    """Формування повідомлень з питаннями для відправки (questions - записи question_store)"""
+    # Порядок варіантів свій для кожного користувача і доби, тому кнопки будуються на повідомлення
+    today = local_today()
+    messages = []
+    for i, question in enumerate(questions, 1):
+        messages.append({
+            'text': f"Питання {i}/{len(questions)}:\n{question.text}",
+            'reply_markup': InlineKeyboardMarkup(question.keyboard(telegram_id, today))
+        })
+    return messages
+
+async def send_daily_questions(bot, *criteria):
+    """Відправка щоденних питань (criteria - умови на User для слоту розсилки)"""
+    # Набори на день генеруються одним проходом у першому слоті, далі розсилка лише читає їх за індексом
+    await ensure_daily_sets(by_category=question_store.category_index())
+    
+    if not len(question_store):
+        logger.warning("Щоденна розсилка пропущена: в базі немає питань")
+        return
+    
+    async def jobs():
+        async for chat_id, question_ids in iter_daily_sets(criteria=criteria):
+            yield chat_id, build_question_messages(question_store.get_many(question_ids), chat_id)
+    
+    stats = await broadcaster.run(bot, jobs())
+    logger.info(f"Щоденна розсилка завершена: {stats}")
+
+async def send_daily_test(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Відправка щоденного тесту користувачу, який його запросив"""
+    user = await user_cache.get(update.effective_user.id)
+    if not user:
+        await update.message.reply_text("Будь ласка, зареєструйтесь спочатку")
+        return
+    
+    questions = question_store.get_many(
+        await get_daily_set(user.id, by_category=question_store.category_index())
+    )
+    if not questions:
+        await update.message.reply_text("Питання ще не додані. Спробуйте пізніше.")
+        return
+    
+    messages = build_question_messages(questions, update.effective_user.id)
+    await broadcaster.send_messages(context.bot, update.effective_chat.id, messages)
 
 async def handle_answer(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обробник відповіді на питання"""
     query = update.callback_query
     await query.answer()
     
-    # Отримання ID питання з callback_data
-    question_id = int(query.data.split('_')[1])
+    # callback_data: answer_<id питання>_<позиція кнопки>_<доба>; у повідомленнях,
+    # надісланих до перемішування за користувачем, - answer_<id>_<варіант> (0 - правильний)
+    parts = query.data.split('_')
+    question_id = int(parts[1])
     
-    async for session in get_session():
-        question = await session.execute(select(Question).filter(Question.id == question_id))
-        question = question.scalar_one_or_none()
+    question = question_store.get(question_id)
+    if question:
+        if len(parts) > 3:
+            option = question.option_at(update.effective_user.id, int(parts[3]), int(parts[2]))
+            code = answer_code(DAILY, option)
+        else:
+            code = parse_answer(query.data)
+        is_correct = decode_answer(code)[1] == 0
+        
+        # Збереження відповіді
+        user = await user_cache.get(update.effective_user.id)
         
-        if question:
-            # Збереження відповіді
-            user = await session.execute(select(User).filter(User.telegram_id == update.effective_user.id))
-            user = user.scalar_one_or_none()
+        if user:
+            # Зараховується лише перша відповідь за добу; варіанти прибираються, лишається пояснення
+            if not await answer_writer.first_answer(user.id, question.id):
+                await query.message.reply_text("Ви вже відповіли на це питання сьогодні")
+                return
             
-            if user:
-                answer = UserAnswer(
-                    user_id=user.id,
-                    question_id=question.id,
-                    answer=query.data,
-                    is_correct=True
-                )
-                session.add(answer)
-                await session.commit()
-                
-                # Оновлення статистики
-                user.daily_score += 1
-                user.total_score += 1
-                await session.commit()
-                
+            # Відповідь і приріст рахунку записуються пакетом у фоні
+            answer_writer.submit(user, question.id, code, is_correct=is_correct, points=int(is_correct))
+            await query.edit_message_reply_markup(InlineKeyboardMarkup([[question.explain_button]]))
+            
+            if is_correct:
+                leaderboard.add_points(user, 1)
                 await query.message.reply_text("Правильно! +1 бал")
             else:
-                await query.message.reply_text("Будь ласка, зареєструйтесь спочатку")
+                await query.message.reply_text(question.wrong_reply)
+        else:
+            await query.message.reply_text("Будь ласка, зареєструйтесь спочатку")
 
 async def show_explanation(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показ пояснення до відповіді"""
@@ -174,76 +213,144 @@ async def show_explanation(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     question_id = int(query.data.split('_')[1])
     
-    async for session in get_session():
-        question = await session.execute(select(Question).filter(Question.id == question_id))
-        question = question.scalar_one_or_none()
-        
-        if question:
-            await query.message.reply_text(f"Пояснення: {question.explanation}")
+    question = question_store.get(question_id)
+    if question:
+        await query.message.reply_text(question.explanation_reply)
 
 async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показ статистики користувача"""
-    query = update.callback_query
-    await query.answer()
+    if update.callback_query:
+        await update.callback_query.answer()
     
-    async for session in get_session():
-        user = await session.execute(select(User).filter(User.telegram_id == update.effective_user.id))
-        user = user.scalar_one_or_none()
-        
-        if user:
-            stats_text = (
-                f"Статистика користувача {user.full_name}:\n"
-                f"Щоденний рахунок: {user.daily_score}\n"
-                f"Загальний рахунок: {user.total_score}\n"
-                f"Місто: {user.city}\n"
-                f"Посада: {user.position}"
-            )
-            await query.message.reply_text(stats_text)
-        else:
-            await query.message.reply_text("Будь ласка, зареєструйтесь спочатку")
+    user = await user_cache.get(update.effective_user.id)
+    
+    if user:
+        stats_text = (
+            f"Статистика користувача {user.full_name}:\n"
+            f"Щоденний рахунок: {user.daily_score}\n"
+            f"Загальний рахунок: {user.total_score}\n"
+            f"Заклад: {user.city}\n"
+            f"Посада: {user.position}"
+        )
+        await update.effective_message.reply_text(stats_text)
+    else:
+        await update.effective_message.reply_text("Будь ласка, зареєструйтесь спочатку")
 
 async def show_knowledge_base(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Показ бази знань"""
-    query = update.callback_query
-    await query.answer()
+    """Показ бази знань: категорії та пошук за текстом"""
+    if update.callback_query:
+        await update.callback_query.answer()
     
+    categories = await knowledge_base.categories()
     keyboard = [
-        [InlineKeyboardButton("Сервіс", callback_data='kb_service')],
-        [InlineKeyboardButton("Меню", callback_data='kb_menu')],
-        [InlineKeyboardButton("Безпека", callback_data='kb_safety')],
-        [InlineKeyboardButton("Кулінарія", callback_data='kb_cooking')],
-        [InlineKeyboardButton("Етикет", callback_data='kb_etiquette')]
+        [InlineKeyboardButton(category, callback_data=f'kb_{category_key(category)}')]
+        for category in categories
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    await query.message.reply_text(
-        "Оберіть категорію для перегляду:",
+    await update.effective_message.reply_text(
+        "Оберіть категорію для перегляду або надішліть запит для пошуку, наприклад: стейк температура",
         reply_markup=reply_markup
     )
+    context.user_data['state'] = 'kb_search'
+
+def knowledge_page(hits, page, title):
+    """Текст і кнопки сторінки результатів бази знань"""
+    page_size = config.KB_PAGE_SIZE
+    pages = max(1, (len(hits) + page_size - 1) // page_size)
+    page = min(max(page, 0), pages - 1)
+    start = page * page_size
+    items = hits[start:start + page_size]
+    
+    if not items:
+        return f"{title}: нічого не знайдено", None
+    
+    lines = [f"{title}: знайдено {len(hits)} ({start + 1}-{start + len(items)})", ""]
+    for number, hit in enumerate(items, start + 1):
+        icon = "📄" if hit.kind == 0 else "❓"
+        lines.append(f"{number}. {icon} {hit.title} [{hit.category}]")
+        if hit.snippet:
+            lines.append(f"   {hit.snippet}")
+    
+    keyboard = [[
+        InlineKeyboardButton(str(number), callback_data=f'kbo_{hit.key}')
+        for number, hit in enumerate(items, start + 1)
+    ]]
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton("◀️", callback_data=f'kbp_{page - 1}'))
+    if page < pages - 1:
+        navigation.append(InlineKeyboardButton("▶️", callback_data=f'kbp_{page + 1}'))
+    if navigation:
+        keyboard.append(navigation)
+    return "\n".join(lines), InlineKeyboardMarkup(keyboard)
+
+def knowledge_title(query, category):
+    return f"🔎 «{query}»" if query else f"📚 {category}"
+
+async def search_knowledge(update: Update, context: ContextTypes.DEFAULT_TYPE, query: str):
+    """Пошук у базі знань за текстом"""
+    hits = await knowledge_base.search(query)
+    context.user_data['kb_query'] = (query, None)
+    text, reply_markup = knowledge_page(hits, 0, knowledge_title(query, None))
+    await update.message.reply_text(text, reply_markup=reply_markup)
+
+async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обробник команди /search <запит>"""
+    query = " ".join(context.args)
+    if not query:
+        await update.message.reply_text("Використання: /search стейк температура")
+        return
+    await search_knowledge(update, context, query)
 
 async def show_knowledge_category(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Показ інформації з обраної категорії"""
+    """Показ статей і питань з обраної категорії"""
     query = update.callback_query
     await query.answer()
     
-    category = query.data.split('_')[1]
+    # Кнопка містить ключ назви, а не позицію у списку, тому після імпорту не відкриє іншу категорію
+    category = await knowledge_base.category(query.data.split('_', 1)[1])
+    if category is None:
+        await query.message.reply_text("Інформація відсутня")
+        return
     
-    # TODO: Додати інформацію для кожної категорії
-    category_info = {
-        'service': "Інформація про сервіс...",
-        'menu': "Інформація про меню...",
-        'safety': "Інформація про безпеку...",
-        'cooking': "Інформація про кулінарію...",
-        'etiquette': "Інформація про етикет..."
-    }
+    hits = await knowledge_base.search(category=category)
+    context.user_data['kb_query'] = ('', category)
+    text, reply_markup = knowledge_page(hits, 0, knowledge_title('', category))
+    await query.message.reply_text(text, reply_markup=reply_markup)
+
+async def show_knowledge_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Гортання сторінок результатів бази знань"""
+    query = update.callback_query
+    await query.answer()
     
-    await query.message.reply_text(category_info.get(category, "Інформація відсутня"))
+    last_query = context.user_data.get('kb_query')
+    if not last_query:
+        return
+    search_text, category = last_query
+    hits = await knowledge_base.search(search_text, category)
+    text, reply_markup = knowledge_page(hits, int(query.data.split('_')[1]), knowledge_title(search_text, category))
+    if text != query.message.text:
+        await query.edit_message_text(text, reply_markup=reply_markup)
 
-async def start_feedback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Початок процесу зворотного зв'язку"""
+async def show_knowledge_item(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Повний текст статті або пояснення до питання"""
     query = update.callback_query
     await query.answer()
     
+    item = await knowledge_base.get(query.data.split('_')[1])
+    if item is None:
+        await query.message.reply_text("Інформація відсутня")
+        return
+    title, body = item
+    # Обмеження Telegram на довжину повідомлення - 4096 символів
+    await query.message.reply_text(f"{title}\n\n{body}"[:4096])
+
+async def start_feedback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Початок процесу зворотного зв'язку"""
+    if update.callback_query:
+        await update.callback_query.answer()
+    
     keyboard = [
         [InlineKeyboardButton("Оцінити навчання", callback_data='feedback_learning')],
         [InlineKeyboardButton("Оцінити оновлення меню", callback_data='feedback_menu')],
@@ -251,7 +358,7 @@ async def start_feedback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    await query.message.reply_text(
+    await update.effective_message.reply_text(
         "Оберіть тип зворотного зв'язку:",
         reply_markup=reply_markup
     )
@@ -285,60 +392,73 @@ async def handle_feedback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.message.reply_text("Будь ласка, введіть ваші пропозиції щодо покращення:")
         context.user_data['state'] = 'waiting_suggestion'
 
+async def handle_rating(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обробка оцінки: callback_data rate_<1-5> (навчання) або rate_menu_<1-5> (оновлення меню)"""
+    query = update.callback_query
+    await query.answer()
+    
+    parts = query.data.split('_')
+    topic = parts[1] if len(parts) == 3 else 'learning'
+    if topic not in FEEDBACK_TOPICS or not parts[-1].isdigit() or not MIN_SCORE <= int(parts[-1]) <= MAX_SCORE:
+        return
+    
+    user = await user_cache.get(update.effective_user.id)
+    if not user:
+        await query.message.reply_text("Будь ласка, зареєструйтесь спочатку")
+        return
+    
+    # Оцінка записується пакетом у фоні; кнопки прибираємо, щоб не оцінювати двічі
+    feedback_writer.submit_rating(user, topic, int(parts[-1]))
+    await query.edit_message_text(f"{query.message.text}\nВаша оцінка: {parts[-1]}. Дякуємо!")
+
 async def handle_suggestion(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обробка пропозицій щодо покращення"""
     if context.user_data.get('state') != 'waiting_suggestion':
         return
     
-    suggestion = update.message.text
-    
-    # TODO: Зберегти пропозицію в базі даних
+    user = await user_cache.get(update.effective_user.id)
+    feedback_writer.submit_suggestion(user, update.message.text)
     
     await update.message.reply_text("Дякуємо за ваші пропозиції! Ми їх обов'язково розглянемо.")
     context.user_data['state'] = None
 
 async def start_game(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Запуск HTML5 гри"""
-    # Отримуємо випадкові питання з бази даних
-    async for session in get_session():
-        questions = await session.execute(
-            select(Question).order_by(func.random()).limit(10)
-        )
-        questions = questions.scalars().all()
-        
-        # Формуємо дані для гри
-        game_data = {
-            "questions": [
-                {
-                    "text": q.text,
-                    "options": [
-                        q.correct_answer,
-                        "Неправильна відповідь 1",
-                        "Неправильна відповідь 2",
-                        "Неправильна відповідь 3"
-                    ],
-                    "correct_answer": q.correct_answer,
-                    "explanation": q.explanation
-                } for q in questions
-            ]
-        }
-        
-        # Кодуємо дані гри в URL
-        encoded_data = json.dumps(game_data)
-        game_url = f"https://kultup.github.io/QuizKM/index.html?data={encoded_data}"
-        
-        # Створюємо кнопку для запуску гри
-        keyboard = [[KeyboardButton(
-            text="🎮 Почати гру",
-            web_app=WebAppInfo(url=game_url)
-        )]]
-        reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-        
-        # Відправляємо повідомлення з кнопкою
-        await update.message.reply_text(
-            "Натисніть кнопку нижче, щоб почати гру:",
-            reply_markup=reply_markup
-        )
+    # Випадкові питання зі знімка банку питань
+    questions = question_store.pick(10)
+    if not questions:
+        await update.message.reply_text("Питання ще не додані. Спробуйте пізніше.")
+        return
+    
+    # Питання і правильні відповіді зберігаються в сесії на сервері,
+    # а гра отримує їх за коротким токеном
+    session = game_sessions.create(update.effective_user.id, [(q, q.options) for q in questions])
+    game_url = f"{config.GAME_URL}?{urlencode({'session': session.token, 'api': config.GAME_API_URL})}"
+    
+    # Створюємо кнопку для запуску гри
+    keyboard = [[KeyboardButton(
+        text="🎮 Почати гру",
+        web_app=WebAppInfo(url=game_url)
+    )]]
+    reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+    
+    # Відправляємо повідомлення з кнопкою
+    await update.message.reply_text(
+        "Натисніть кнопку нижче, щоб почати гру:",
+        reply_markup=reply_markup
+    )
+
+def grade_game(game, posted_answers):
+    """Перевірка відповідей гри за виданою сесією: список (question_id, варіант, чи правильно)
+
+    Правильні варіанти зафіксовані в сесії при старті, тому перезавантаження банку питань
+    під час гри не змінює оцінку, і вона збігається з перевіркою окремих відповідей у грі.
+    """
+    options = game.final_answers(posted_answers)
+    return [
+        (question['id'], option, option >= 0 and option == question['correct'])
+        for question, option in zip(game.questions, options)
+    ]
 
 async def handle_game_result(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обробка результатів гри"""
@@ -349,115 +469,277 @@ async def handle_game_result(update: Update, context: ContextTypes.DEFAULT_TYPE)
         data = json.loads(update.message.web_app_data.data)
         
         if data['type'] == 'game_complete':
-            score = data['score']
+            user = await user_cache.get(update.effective_user.id)
             
-            async for session in get_session():
-                user = await session.execute(
-                    select(User).filter(User.telegram_id == update.effective_user.id)
-                )
-                user = user.scalar_one_or_none()
+            if user:
+                # Рахунок від клієнта не використовується: відповіді перевіряються за виданою сесією
+                # Сесія закривається лише її власником: чужий токен не знищує гру іншого гравця
+                game = game_sessions.get(data.get('session'))
+                if game is None or game.telegram_id != update.effective_user.id:
+                    await update.message.reply_text("Гру не знайдено або її час вичерпано. Почніть нову гру.")
+                    return
+                game_sessions.pop(game.token)
+                
+                graded = grade_game(game, data.get('answers') or [])
+                score = sum(1 for _, _, is_correct in graded if is_correct)
+                
+                # Усі відповіді гри та приріст рахунку потрапляють в одну транзакцію запису
+                for question_id, option, is_correct in graded:
+                    answer_writer.submit(user, question_id, answer_code(GAME, option), is_correct)
+                if score:
+                    answer_writer.add_score(user, score)
+                    leaderboard.add_points(user, score)
                 
-                if user:
-                    # Оновлення статистики
-                    user.daily_score = score
-                    user.total_score += score
-                    await session.commit()
-                    
-                    await update.message.reply_text(
-                        f"Гра завершена! Ваш рахунок: {score}/5\n"
-                        f"Загальний рахунок: {user.total_score}"
-                    )
-                else:
-                    await update.message.reply_text(
-                        "Помилка: користувач не знайдений. Будь ласка, зареєструйтесь спочатку."
-                    )
+                await update.message.reply_text(
+                    f"Гра завершена! Ваш рахунок: {score}/{len(graded)}\n"
+                    f"Загальний рахунок: {leaderboard.score(user.id)}"
+                )
+            else:
+                await update.message.reply_text(
+                    "Помилка: користувач не знайдений. Будь ласка, зареєструйтесь спочатку."
+                )
     except Exception as e:
         logger.error(f"Помилка при обробці результатів гри: {e}")
         await update.message.reply_text(
             "Виникла помилка при обробці результатів гри. Будь ласка, спробуйте ще раз."
         )
 
-async def send_daily_questions_periodically():
-    """Періодична відправка щоденних питань"""
-    while True:
-        now = datetime.now().time()
-        target_time = time(hour=12, minute=0)
-        
-        if now.hour == target_time.hour and now.minute == target_time.minute:
-            await send_daily_questions()
-            # Чекаємо 24 години
-            await asyncio.sleep(24 * 60 * 60)
-        else:
-            # Перевіряємо кожну хвилину
-            await asyncio.sleep(60)
+LEADERBOARD_WINDOWS = {
+    'day': "за сьогодні",
+    'week': "за тиждень",
+    'all': "за весь час"
+}
 
-def main():
-    """Запуск бота"""
-    # Створення додатку
-    application = Application.builder().token(TOKEN).build()
+def format_leaderboard(user, window):
+    """Текст рейтингу з топ-10 та місцем користувача"""
+    lines = [f"🏆 Рейтинг {LEADERBOARD_WINDOWS[window]}:"]
+    top = leaderboard.top(10, window=window)
+    if not top:
+        lines.append("Поки що немає результатів")
+    for i, (_, name, score) in enumerate(top, 1):
+        lines.append(f"{i}. {name} — {score}")
+    
+    places = [
+        ("Ваше місце", 'global'),
+        (f"У закладі «{user.city}»", 'city'),
+        (f"Серед посади «{user.position}»", 'position')
+    ]
+    lines.append("")
+    for label, scope in places:
+        rank, total = leaderboard.rank(user.id, window=window, scope=scope)
+        lines.append(f"{label}: {rank} з {total}" if rank else f"{label}: ще немає балів")
+    return "\n".join(lines)
+
+def leaderboard_keyboard():
+    """Кнопки перемикання періоду рейтингу"""
+    return InlineKeyboardMarkup([[
+        InlineKeyboardButton(title.capitalize(), callback_data=f'lb_{window}')
+        for window, title in LEADERBOARD_WINDOWS.items()
+    ]])
+
+async def show_leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показ рейтингу користувачів"""
+    user = await user_cache.get(update.effective_user.id)
+    if not user:
+        await update.message.reply_text("Будь ласка, зареєструйтесь спочатку")
+        return
+    
+    await update.message.reply_text(format_leaderboard(user, 'all'), reply_markup=leaderboard_keyboard())
+
+async def show_leaderboard_window(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Перемикання періоду рейтингу"""
+    query = update.callback_query
+    await query.answer()
+    
+    window = query.data.split('_')[1]
+    user = await user_cache.get(update.effective_user.id)
+    if not user or window not in LEADERBOARD_WINDOWS:
+        return
+    
+    text = format_leaderboard(user, window)
+    if text != query.message.text:
+        await query.edit_message_text(text, reply_markup=leaderboard_keyboard())
+
+async def send_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обробник команди /report <тип> [днів] - звіт аналітики у CSV (лише для адміністраторів)"""
+    if update.effective_user.id not in config.ADMIN_IDS:
+        await update.message.reply_text("Команда доступна лише адміністраторам")
+        return
+    
+    args = context.args
+    if not args or args[0] not in REPORTS or (len(args) > 1 and not args[1].isdigit()):
+        reports = "\n".join(f"{name} - {title}" for name, title in REPORTS.items())
+        await update.message.reply_text(f"Використання: /report <тип> [днів]\n\n{reports}")
+        return
+    
+    name = args[0]
+    days = int(args[1]) if len(args) > 1 else None
+    data = report_csv(*await build_report(name, days))
+    period = f"за {days} дн." if days else "за весь час"
+    await update.message.reply_document(
+        document=io.BytesIO(data),
+        filename=f"{name}_{datetime.utcnow():%Y%m%d}.csv",
+        caption=f"{REPORTS[name]} {period}"
+    )
+
+async def start_user_sync(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обробник команди /sync_users [check] - очікування файлу співробітників (лише для адміністраторів)"""
+    if update.effective_user.id not in config.ADMIN_IDS:
+        await update.message.reply_text("Команда доступна лише адміністраторам")
+        return
+    
+    context.user_data['state'] = 'waiting_staff_file'
+    context.user_data['staff_dry_run'] = context.args == ['check']
+    await update.message.reply_text(
+        f"Надішліть файл CSV або JSONL з полями {', '.join(STAFF_FIELDS)}.\n"
+        "Нові співробітники будуть зареєстровані, у наявних оновляться ім'я, заклад і посада."
+    )
+
+async def handle_staff_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Файл співробітників після /sync_users - пакетна синхронізація користувачів"""
+    if update.effective_user.id not in config.ADMIN_IDS or context.user_data.get('state') != 'waiting_staff_file':
+        return
+    
+    document = update.message.document
+    try:
+        fmt = detect_format(document.file_name or '')
+    except ValueError:
+        await update.message.reply_text("Потрібен файл .csv або .jsonl")
+        return
+    context.user_data['state'] = None
+    dry_run = context.user_data.pop('staff_dry_run', False)
+    
+    data = await (await document.get_file()).download_as_bytearray()
+    rows = parse_rows(io.TextIOWrapper(io.BytesIO(data), encoding='utf-8-sig', newline=''), fmt)
+    stats = await sync_users(rows, dry_run=dry_run)
+    if not dry_run and (stats.inserted or stats.updated):
+        await directory_watcher.check()
+    lines = [f"Синхронізація {document.file_name}{' (перевірка)' if dry_run else ''}: {stats}"]
+    lines.extend(stats.errors)
+    await update.message.reply_text("\n".join(lines))
+
+async def handle_knowledge_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Довільний текст після відкриття бази знань - один пошуковий запит"""
+    context.user_data.pop('state', None)
+    await search_knowledge(update, context, update.message.text)
+
+# Рейтинг перезавантажується після синхронізації співробітників (також з CLI)
+directory_watcher = DirectoryWatcher(on_change=leaderboard.load)
+
+def build_router():
+    """Маршрути текстових повідомлень і callback-запитів"""
+    router = Router()
+    # Незавершена реєстрація перехоплює будь-який текст
+    router.wizard('registration_step', handle_registration)
     
-    # Додавання обробників
+    router.text("📝 Щоденний тест", send_daily_test)
+    router.text("📊 Статистика", show_stats)
+    router.text("📚 База знань", show_knowledge_base)
+    router.text("🎮 Почати гру", start_game)
+    router.text("🏆 Рейтинг", show_leaderboard)
+    router.text("💬 Зворотний зв'язок", start_feedback)
+    
+    router.state('waiting_suggestion', handle_suggestion)
+    router.state('kb_search', handle_knowledge_query)
+    
+    router.callback('answer', handle_answer)
+    router.callback('explain', show_explanation)
+    router.callback('feedback', handle_feedback)
+    router.callback('rate', handle_rating)
+    router.callback('kb', show_knowledge_category)
+    router.callback('kbp', show_knowledge_page)
+    router.callback('kbo', show_knowledge_item)
+    router.callback('lb', show_leaderboard_window)
+    return router
+
+async def post_init(application: Application):
+    """Запуск фонових задач на циклі подій бота"""
+    async for session in get_session():
+        await backfill_directory(session)
+    await refresh_distractors()
+    await question_store.load()
+    question_store.start(config.QUESTION_RELOAD_INTERVAL)
+    await leaderboard.load()
+    await directory_watcher.check()
+    directory_watcher.start(config.QUESTION_RELOAD_INTERVAL)
+    await knowledge_base.init()
+    knowledge_base.start(config.QUESTION_RELOAD_INTERVAL)
+    web_app = create_app()
+    update_dispatcher = application.bot_data.get('update_dispatcher')
+    if update_dispatcher:
+        update_dispatcher.setup(web_app)
+    application.bot_data['web_runner'] = await start_web_server(web_app)
+    scheduler = DailyScheduler(misfire_grace=config.SCHEDULER_MISFIRE_GRACE)
+    setup_daily_jobs(scheduler, partial(send_daily_questions, application.bot))
+    await scheduler.start()
+    application.bot_data['scheduler'] = scheduler
+    answer_writer.start()
+    feedback_writer.start()
+
+async def post_shutdown(application: Application):
+    """Зупинка планувальника і HTTP-сервера, збереження буферизованих відповідей та закриття з'єднань з базою даних"""
+    router = application.bot_data.get('router')
+    summary = router.summary() if router else ''
+    if summary:
+        logger.info(f"Затримки обробників:\n{summary}")
+    scheduler = application.bot_data.pop('scheduler', None)
+    if scheduler:
+        scheduler.shutdown()
+    web_runner = application.bot_data.pop('web_runner', None)
+    if web_runner:
+        await web_runner.cleanup()
+    await question_store.stop()
+    await knowledge_base.stop()
+    await directory_watcher.stop()
+    await answer_writer.stop()
+    await feedback_writer.stop()
+    await close_db()
+
+# Типи оновлень, які бот обробляє (дані WebApp приходять у message)
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
+
+def register_handlers(application: Application):
+    """Додавання обробників (спільне для бота та навантажувального тесту)"""
     application.add_handler(CommandHandler("start", start))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_registration))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    application.add_handler(CommandHandler("search", search_command))
+    application.add_handler(CommandHandler("report", send_report))
+    application.add_handler(CommandHandler("sync_users", start_user_sync))
+    application.add_handler(MessageHandler(filters.Document.ALL, handle_staff_file))
     application.add_handler(MessageHandler(filters.StatusUpdate.WEB_APP_DATA, handle_game_result))
     
+    # Весь текст і всі callback-запити проходять через один маршрутизатор
+    router = build_router()
+    application.bot_data['router'] = router
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, router.handle_message))
+    application.add_handler(CallbackQueryHandler(router.handle_callback))
+
+def main():
+    """Запуск бота"""
+    # Створення додатку
+    persistence = SQLPersistence(
+        update_interval=config.PERSISTENCE_INTERVAL,
+        shared=config.PERSISTENCE_SHARED
+    )
+    application = (
+        Application.builder().token(TOKEN).persistence(persistence)
+        .post_init(post_init).post_shutdown(post_shutdown).build()
+    )
+    register_handlers(application)
+    
     # Запуск бота
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
-
-async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обробник текстових повідомлень"""
-    text = update.message.text
-    
-    if text == "📝 Щоденний тест":
-        # Логіка для щоденного тесту
-        await send_daily_questions()
-    elif text == "📊 Статистика":
-        # Показ статистики
-        async for session in get_session():
-            user = await session.execute(select(User).filter(User.telegram_id == update.effective_user.id))
-            user = user.scalar_one_or_none()
-            
-            if user:
-                stats_text = (
-                    f"Статистика користувача {user.full_name}:\n"
-                    f"Щоденний рахунок: {user.daily_score}\n"
-                    f"Загальний рахунок: {user.total_score}\n"
-                    f"Заклад: {user.city}\n"
-                    f"Посада: {user.position}"
-                )
-                await update.message.reply_text(stats_text)
-    elif text == "📚 База знань":
-        # Показ категорій бази знань
-        keyboard = [
-            ["🍽️ Сервіс", "📋 Меню"],
-            ["🛡️ Безпека", "👨‍🍳 Кулінарія"],
-            ["🎭 Етикет", "⬅️ Назад"]
-        ]
-        reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-        await update.message.reply_text("Оберіть категорію:", reply_markup=reply_markup)
-    elif text == "🎮 Почати гру":
-        # Запуск гри
-        await start_game(update, context)
-    elif text == "⬅️ Назад":
-        # Повернення до головного меню
-        keyboard = [
-            ["📝 Щоденний тест"],
-            ["📊 Статистика", "📚 База знань"],
-            ["🎮 Почати гру"]
-        ]
-        reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-        await update.message.reply_text("Головне меню:", reply_markup=reply_markup)
+    if config.BOT_MODE == 'webhook':
+        run_webhook(application, ALLOWED_UPDATES)
+    else:
+        application.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 if __name__ == '__main__':
     try:
         # Ініціалізація бази даних
         asyncio.run(init_db())
         
-        # Запуск періодичної відправки питань в окремому потоці
+        # Новий цикл подій для бота (asyncio.run закриває попередній)
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
-        loop.create_task(send_daily_questions_periodically())
         
         # Запуск бота
         main()
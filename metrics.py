@@ -0,0 +1,211 @@
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+# Межі кошиків гістограми затримок у секундах
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Маршрут (обробник), в межах якого виконується поточний код; запити до бази
+# з фонових задач потрапляють у 'background'
+current_route = ContextVar('current_route', default='background')
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self, name, labels):
+        yield name, labels, self.value
+
+
+class Gauge:
+    def __init__(self, func=None):
+        self.value = 0.0
+        self.func = func
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def samples(self, name, labels):
+        yield name, labels, self.func() if self.func else self.value
+
+
+class Histogram:
+    """Гістограма з фіксованими кошиками: лічильники, сума та оцінка квантилів"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Верхня межа кошика, в який потрапляє квантиль q (None для порожньої гістограми)"""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float('inf')
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket', labels + (('le', repr(bound)),), cumulative
+        yield f'{name}_bucket', labels + (('le', '+Inf'),), self.count
+        yield f'{name}_sum', labels, self.sum
+        yield f'{name}_count', labels, self.count
+
+
+class Family:
+    """Метрика з мітками: окремий екземпляр Counter/Gauge/Histogram на кожен набір значень міток"""
+
+    def __init__(self, name, help_text, kind, factory, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.factory = factory
+        self.labelnames = labelnames
+        self.children = {}
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = self.factory()
+        return child
+
+    def __getattr__(self, attr):
+        # Метрика без міток поводиться як єдиний екземпляр: counter.inc(), gauge.set()
+        if attr.startswith('_') or self.labelnames:
+            raise AttributeError(attr)
+        return getattr(self.labels(), attr)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for values, child in self.children.items():
+            for name, labels, value in child.samples(self.name, tuple(zip(self.labelnames, values))):
+                label_text = ','.join(f'{k}="{_escape(v)}"' for k, v in labels)
+                lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+        return '\n'.join(lines)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Registry:
+    """Набір метрик у текстовому форматі Prometheus"""
+
+    def __init__(self):
+        self.families = {}
+
+    def _add(self, name, help_text, kind, factory, labelnames):
+        family = self.families.get(name)
+        if family is None:
+            family = self.families[name] = Family(name, help_text, kind, factory, tuple(labelnames))
+        return family
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._add(name, help_text, 'counter', Counter, labelnames)
+
+    def gauge(self, name, help_text, labelnames=(), func=None):
+        """Gauge; з func значення обчислюється під час збору метрик"""
+        family = self._add(name, help_text, 'gauge', lambda: Gauge(func), labelnames)
+        if func is not None:
+            family.labels()
+        return family
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(name, help_text, 'histogram', lambda: Histogram(buckets), labelnames)
+
+    def render(self):
+        return '\n'.join(family.render() for family in self.families.values()) + '\n'
+
+
+registry = Registry()
+
+handler_latency = registry.histogram(
+    'quizkm_handler_latency_seconds', "Час обробки оновлення за маршрутом", ('route',)
+)
+handler_errors = registry.counter(
+    'quizkm_handler_errors_total', "Винятки в обробниках за маршрутом", ('route',)
+)
+db_queries = registry.counter(
+    'quizkm_db_queries_total', "Кількість SQL-запитів за маршрутом", ('route',)
+)
+db_query_seconds = registry.counter(
+    'quizkm_db_query_seconds_total', "Сумарний час SQL-запитів за маршрутом", ('route',)
+)
+db_query_latency = registry.histogram(
+    'quizkm_db_query_duration_seconds', "Тривалість окремого SQL-запиту"
+)
+broadcast_messages = registry.counter(
+    'quizkm_broadcast_messages_total', "Повідомлення розсилки за результатом", ('result',)
+)
+broadcast_retries = registry.counter(
+    'quizkm_broadcast_retries_total', "Повторні спроби відправки"
+)
+telegram_retry_after = registry.counter(
+    'quizkm_telegram_retry_after_total', "Відповіді 429 (flood control) від Telegram"
+)
+broadcast_queue_depth = registry.gauge(
+    'quizkm_broadcast_queue_depth', "Кількість чатів у черзі розсилки"
+)
+update_queue_depth = registry.gauge(
+    'quizkm_update_queue_depth', "Кількість оновлень у черзі вебхука"
+)
+user_cache_hits = registry.counter(
+    'quizkm_user_cache_hits_total', "Знаходження користувача в кеші без запиту до бази"
+)
+user_cache_misses = registry.counter(
+    'quizkm_user_cache_misses_total', "Промахи кешу користувачів (запит до бази)"
+)
+user_cache_evictions = registry.counter(
+    'quizkm_user_cache_evictions_total', "Витіснення з кешу користувачів через ліміт розміру"
+)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    route = current_route.get()
+    db_queries.labels(route).inc()
+    db_query_seconds.labels(route).inc(elapsed)
+    db_query_latency.observe(elapsed)
+
+
+def _handle_error(context):
+    # Запит з помилкою не доходить до after_cursor_execute
+    started = context.connection.info.get('query_started') if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+def instrument_engine(sync_engine):
+    """Облік кількості та часу SQL-запитів за маршрутом через події рушія"""
+    event.listen(sync_engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(sync_engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(sync_engine, 'handle_error', _handle_error)
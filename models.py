@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, SmallInteger, String, Boolean, Date, DateTime, Float, ForeignKey, Text, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -11,34 +11,177 @@ class User(Base):
     id = Column(Integer, primary_key=True)
     telegram_id = Column(Integer, unique=True)
     full_name = Column(String)
+    # Назви закладу та посади з довідників (для відображення); фільтри використовують *_id
     city = Column(String)
     position = Column(String)
+    establishment_id = Column(Integer, ForeignKey('establishments.id'), index=True)
+    position_id = Column(Integer, ForeignKey('positions.id'), index=True)
     registered_at = Column(DateTime, default=datetime.utcnow)
     daily_score = Column(Integer, default=0)
     total_score = Column(Integer, default=0)
     
     answers = relationship("UserAnswer", back_populates="user")
 
+class Establishment(Base):
+    __tablename__ = 'establishments'
+    
+    id = Column(Integer, primary_key=True)
+    # Назва без урахування регістру та пробілів (user_directory.name_key) для усунення дублікатів
+    key = Column(String, unique=True, nullable=False)
+    name = Column(String, nullable=False)
+
+class Position(Base):
+    __tablename__ = 'positions'
+    
+    id = Column(Integer, primary_key=True)
+    key = Column(String, unique=True, nullable=False)
+    name = Column(String, nullable=False)
+
 class Question(Base):
     __tablename__ = 'questions'
     
     id = Column(Integer, primary_key=True)
-    category = Column(String)
+    category = Column(String, index=True)
     text = Column(Text)
     correct_answer = Column(String)
     explanation = Column(Text)
+    # Хеш нормалізованих категорії та тексту для усунення дублікатів при імпорті
+    content_hash = Column(String(40), index=True)
     
     answers = relationship("UserAnswer", back_populates="question")
 
 class UserAnswer(Base):
     __tablename__ = 'user_answers'
+    __table_args__ = (
+        Index('ix_user_answers_user_answered', 'user_id', 'answered_at'),
+        Index('ix_user_answers_question_correct', 'question_id', 'is_correct'),
+        Index('ix_user_answers_answered_at', 'answered_at'),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'))
     question_id = Column(Integer, ForeignKey('questions.id'))
+    # Рядок callback_data у старих записах; нові зберігають лише answer_code (answer_writer.answer_code)
     answer = Column(String)
+    answer_code = Column(SmallInteger)
     is_correct = Column(Boolean)
     answered_at = Column(DateTime, default=datetime.utcnow)
     
     user = relationship("User", back_populates="answers")
-    question = relationship("Question", back_populates="answers") 
\ No newline at end of file
+    question = relationship("Question", back_populates="answers")
+
+class DailyQuestion(Base):
+    __tablename__ = 'daily_questions'
+    
+    # Порядок ключа (day, user_id, position) дозволяє читати набори
+    # одного дня посторінково та набір одного користувача одним діапазоном індексу
+    day = Column(Date, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    position = Column(Integer, primary_key=True)
+    question_id = Column(Integer, ForeignKey('questions.id'))
+
+class QuestionDistractor(Base):
+    __tablename__ = 'question_distractors'
+    
+    # Неправильні варіанти відповіді, підібрані заздалегідь з тієї ж категорії
+    question_id = Column(Integer, ForeignKey('questions.id'), primary_key=True)
+    position = Column(Integer, primary_key=True)
+    text = Column(String)
+
+class QuestionProgress(Base):
+    __tablename__ = 'question_progress'
+    __table_args__ = (
+        Index('ix_question_progress_user_due', 'user_id', 'due'),
+    )
+    
+    # Стан інтервального повторення (система Лейтнера) для пари користувач-питання
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    question_id = Column(Integer, ForeignKey('questions.id'), primary_key=True)
+    box = Column(Integer, default=0)
+    due = Column(Date)
+    reps = Column(Integer, default=0)
+    lapses = Column(Integer, default=0)
+    last_answered_at = Column(DateTime)
+
+class JobRun(Base):
+    __tablename__ = 'job_runs'
+    
+    # Останній запуск щоденної задачі - для пропуску повторів і наздоганяння після перезапуску
+    job_id = Column(String, primary_key=True)
+    run_date = Column(Date)
+    run_at = Column(DateTime)
+    # Час захоплення запуску процесом, що зараз виконує задачу (None - не виконується)
+    claimed_at = Column(DateTime)
+
+class DataVersion(Base):
+    __tablename__ = 'data_versions'
+    
+    # Лічильник змін набору даних (банку питань тощо) для перезавантаження кешів у всіх процесах
+    key = Column(String, primary_key=True)
+    version = Column(Integer, default=0)
+
+class KnowledgeArticle(Base):
+    __tablename__ = 'knowledge_articles'
+    
+    id = Column(Integer, primary_key=True)
+    category = Column(String, index=True)
+    title = Column(String)
+    body = Column(Text)
+    # Хеш нормалізованих категорії та заголовка для оновлення статей при повторному імпорті
+    content_hash = Column(String(40), index=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class DailyCategoryStats(Base):
+    __tablename__ = 'daily_category_stats'
+    
+    # Щоденні підсумки відповідей користувача по категорії, оновлюються разом із записом відповідей
+    day = Column(Date, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    category = Column(String, primary_key=True)
+    attempts = Column(Integer, default=0)
+    correct = Column(Integer, default=0)
+
+class DailyQuestionStats(Base):
+    __tablename__ = 'daily_question_stats'
+    
+    # Щоденні підсумки відповідей на питання - для пошуку найскладніших питань
+    day = Column(Date, primary_key=True)
+    question_id = Column(Integer, ForeignKey('questions.id'), primary_key=True)
+    attempts = Column(Integer, default=0)
+    correct = Column(Integer, default=0)
+
+class PersistentData(Base):
+    __tablename__ = 'persistent_data'
+    
+    # Дані користувачів, чатів та стани розмов бота (JSON), що переживають перезапуск
+    kind = Column(String, primary_key=True)
+    key = Column(String, primary_key=True)
+    data = Column(Text)
+    updated_at = Column(Float)
+
+class FeedbackRating(Base):
+    __tablename__ = 'feedback_ratings'
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), index=True)
+    topic = Column(String)  # learning або menu
+    score = Column(Integer)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class Suggestion(Base):
+    __tablename__ = 'suggestions'
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), index=True)
+    text = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class DailyFeedbackStats(Base):
+    __tablename__ = 'daily_feedback_stats'
+    
+    # Щоденні підсумки оцінок по закладу (establishment_id 0 - без закладу), оновлюються разом із записом оцінок
+    day = Column(Date, primary_key=True)
+    topic = Column(String, primary_key=True)
+    establishment_id = Column(Integer, primary_key=True)
+    ratings = Column(Integer, default=0)
+    score_sum = Column(Integer, default=0)
@@ -0,0 +1,185 @@
+import asyncio
+import json
+import logging
+import time
+
+from sqlalchemy import delete, insert, select
+from telegram.ext import BasePersistence, PersistenceInput
+
+from database import IN_BATCH_SIZE, get_session
+from models import PersistentData
+
+logger = logging.getLogger(__name__)
+
+USER, CHAT = 'user', 'chat'
+CONVERSATION = 'conversation:'
+
+
+def _dump(data):
+    return json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+
+
+class SQLPersistence(BasePersistence):
+    """Збереження user_data, chat_data та станів розмов у таблиці persistent_data
+
+    Дані тримаються в пам'яті, а змінені записи збираються і записуються однією
+    транзакцією через flush_delay секунд після змін. Порожні дані видаляються,
+    тому таблиця містить лише незавершені сценарії (реєстрація, пропозиції тощо).
+    З shared=True дані користувача перечитуються з бази перед кожним оновленням,
+    якщо їх змінив інший процес бота.
+    """
+
+    def __init__(self, update_interval=1.0, flush_delay=0.05, shared=False):
+        # bot_data містить службові об'єкти (HTTP-сервер, планувальник) і не зберігається
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, callback_data=False),
+            update_interval=update_interval
+        )
+        self.flush_delay = flush_delay
+        self.shared = shared
+        self._snapshots = {}
+        self._versions = {}
+        self._dirty = {}
+        self._flush_task = None
+        self._write_lock = None
+
+    async def _load(self, kind):
+        async for session in get_session():
+            result = await session.execute(
+                select(PersistentData.key, PersistentData.data, PersistentData.updated_at)
+                .filter(PersistentData.kind == kind)
+            )
+            rows = result.all()
+        data = {}
+        for key, value, updated_at in rows:
+            self._snapshots[(kind, key)] = value
+            self._versions[(kind, key)] = updated_at
+            data[key] = json.loads(value)
+        return data
+
+    def _set(self, kind, key, data):
+        """Запис у пам'ять і постановка в чергу на запис у базу, якщо дані змінилися"""
+        value = None if data is None or data == {} else _dump(data)
+        item = (kind, str(key))
+        if self._snapshots.get(item) == value:
+            return
+        if value is None:
+            self._snapshots.pop(item, None)
+        else:
+            self._snapshots[item] = value
+        self._dirty[item] = value
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_write())
+
+    async def _delayed_write(self):
+        await asyncio.sleep(self.flush_delay)
+        try:
+            await self._write()
+        except Exception as e:
+            logger.error(f"Помилка при збереженні стану бота: {e}")
+
+    async def _write(self):
+        if self._write_lock is None:
+            self._write_lock = asyncio.Lock()
+        async with self._write_lock:
+            if not self._dirty:
+                return
+            dirty, self._dirty = self._dirty, {}
+            updated_at = time.time()
+            by_kind = {}
+            for kind, key in dirty:
+                by_kind.setdefault(kind, []).append(key)
+            try:
+                async for session in get_session():
+                    for kind, keys in by_kind.items():
+                        for start in range(0, len(keys), IN_BATCH_SIZE):
+                            await session.execute(delete(PersistentData).filter(
+                                PersistentData.kind == kind,
+                                PersistentData.key.in_(keys[start:start + IN_BATCH_SIZE])
+                            ))
+                    rows = [
+                        {'kind': kind, 'key': key, 'data': value, 'updated_at': updated_at}
+                        for (kind, key), value in dirty.items() if value is not None
+                    ]
+                    if rows:
+                        await session.execute(insert(PersistentData), rows)
+                    await session.commit()
+            except Exception:
+                # Новіші зміни, що з'явилися під час запису, мають пріоритет
+                for item, value in dirty.items():
+                    self._dirty.setdefault(item, value)
+                raise
+            for item in dirty:
+                self._versions[item] = updated_at
+
+    async def _refresh(self, kind, key, data):
+        item = (kind, str(key))
+        if not self.shared or item in self._dirty:
+            return
+        async for session in get_session():
+            result = await session.execute(
+                select(PersistentData.data, PersistentData.updated_at)
+                .filter(PersistentData.kind == kind, PersistentData.key == item[1])
+            )
+            row = result.first()
+        if row is None:
+            if self._versions.pop(item, None) is not None:
+                self._snapshots.pop(item, None)
+                data.clear()
+        elif row.updated_at != self._versions.get(item):
+            self._versions[item] = row.updated_at
+            self._snapshots[item] = row.data
+            data.clear()
+            data.update(json.loads(row.data))
+
+    async def get_user_data(self):
+        return {int(key): value for key, value in (await self._load(USER)).items()}
+
+    async def get_chat_data(self):
+        return {int(key): value for key, value in (await self._load(CHAT)).items()}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        data = await self._load(CONVERSATION + name)
+        return {tuple(json.loads(key)): state for key, state in data.items()}
+
+    async def update_user_data(self, user_id, data):
+        self._set(USER, user_id, data)
+
+    async def update_chat_data(self, chat_id, data):
+        self._set(CHAT, chat_id, data)
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def update_conversation(self, name, key, new_state):
+        self._set(CONVERSATION + name, json.dumps(list(key)), new_state)
+
+    async def drop_user_data(self, user_id):
+        self._set(USER, user_id, None)
+
+    async def drop_chat_data(self, chat_id):
+        self._set(CHAT, chat_id, None)
+
+    async def refresh_user_data(self, user_id, user_data):
+        await self._refresh(USER, user_id, user_data)
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        await self._refresh(CHAT, chat_id, chat_data)
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        """Запис усіх незбережених змін (викликається при зупинці бота)"""
+        if self._flush_task is not None and not self._flush_task.done():
+            await self._flush_task
+        await self._write()
@@ -0,0 +1,65 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+MAX_DEPTH = 64
+
+
+class SamplingProfiler:
+    """Семплювальний профайлер потоку циклу подій, що вмикається під час роботи
+
+    Окремий потік кожні interval секунд знімає стек цільового потоку. Результат
+    віддається у форматі collapsed stacks (flamegraph.pl, speedscope). Поки
+    профайлер вимкнено, він нічого не коштує.
+    """
+
+    def __init__(self):
+        self.samples = Counter()
+        self.interval = None
+        self.started_at = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self, interval=0.005, thread_id=None):
+        """Початок збору для потоку thread_id (за замовчуванням - поточного)"""
+        if self.running:
+            return False
+        self.samples.clear()
+        self.interval = interval
+        self.started_at = time.monotonic()
+        self._stop.clear()
+        target = thread_id or threading.get_ident()
+        self._thread = threading.Thread(target=self._sample, args=(target,), name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return True
+
+    def _sample(self, target):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(target)
+            stack = []
+            while frame is not None and len(stack) < MAX_DEPTH:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        """Зупинка збору; повертає стеки у форматі collapsed"""
+        if self.running:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        return self.collapsed()
+
+    def collapsed(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,290 @@
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import logging
+import os
+from itertools import islice
+
+from sqlalchemy import bindparam, insert, select, update
+
+from data_versions import bump_version
+from database import IN_BATCH_SIZE, close_db, get_session, init_db
+from distractors import refresh_distractors
+from models import Question
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('category', 'text', 'correct_answer', 'explanation')
+REQUIRED_FIELDS = ('category', 'text', 'correct_answer')
+MAX_ERRORS_SHOWN = 20
+
+
+def _normalize(value):
+    return ' '.join(str(value or '').split()).casefold()
+
+
+def content_hash(category, text):
+    """Хеш питання без урахування регістру та пробілів: те саме питання з таблиці
+    оновлює наявний запис, а не створює дублікат"""
+    key = f"{_normalize(category)}\x1f{_normalize(text)}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def validate_row(row):
+    """Перевірка рядка імпорту; повертає словник полів Question або кидає ValueError"""
+    if not isinstance(row, dict):
+        raise ValueError("рядок не є об'єктом з полями")
+    question = {}
+    for field in FIELDS:
+        value = row.get(field)
+        if value is not None and not isinstance(value, (str, int, float)):
+            raise ValueError(f"некоректне значення поля {field}")
+        question[field] = str(value).strip() if value is not None else ''
+    missing = [field for field in REQUIRED_FIELDS if not question[field]]
+    if missing:
+        raise ValueError(f"порожні поля: {', '.join(missing)}")
+    question['explanation'] = question['explanation'] or None
+    question['content_hash'] = content_hash(question['category'], question['text'])
+    return question
+
+
+def detect_format(path, fmt=None):
+    if fmt:
+        return fmt
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.jsonl', '.ndjson', '.json'):
+        return 'jsonl'
+    if extension in ('.csv', '.tsv', '.txt'):
+        return 'csv'
+    raise ValueError(f"Невідомий формат файлу {path}, вкажіть --format")
+
+
+def parse_rows(f, fmt):
+    """Потокове читання текстового файлу f у форматі csv або jsonl: пари (номер рядка, словник полів)"""
+    if fmt == 'csv':
+        # Таблиці з Excel часто зберігаються з ';' або табуляцією замість коми
+        try:
+            dialect = csv.Sniffer().sniff(f.read(4096), delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        f.seek(0)
+        reader = csv.DictReader(f, dialect=dialect)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_num, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_num, row
+
+
+def read_rows(path, fmt=None):
+    """Потокове читання файлу: пари (номер рядка, словник полів)"""
+    fmt = detect_format(path, fmt)
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        yield from parse_rows(f, fmt)
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class ImportStats:
+    """Підсумки імпорту"""
+
+    def __init__(self):
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.errors = []
+
+    def error(self, line_num, message):
+        self.invalid += 1
+        if len(self.errors) < MAX_ERRORS_SHOWN:
+            self.errors.append(f"рядок {line_num}: {message}")
+
+    def __str__(self):
+        return (
+            f"додано: {self.inserted}, оновлено: {self.updated}, без змін: {self.unchanged}, "
+            f"дублікатів у файлі: {self.duplicates}, некоректних рядків: {self.invalid}"
+        )
+
+
+def valid_batches(rows, validate, stats, batch_size=IN_BATCH_SIZE):
+    """Пакети рядків файлу, перевірених validate (словник полів або ValueError);
+    некоректні рядки обліковуються в stats з номером рядка"""
+    def valid_rows():
+        for line_num, row in rows:
+            try:
+                yield validate(row)
+            except ValueError as e:
+                stats.error(line_num, e)
+
+    return batches(valid_rows(), batch_size)
+
+
+def unique_by(items, key, stats):
+    """Записи пакету за ключем key: повтор у файлі замінює попередній запис і рахується в stats.duplicates"""
+    by_key = {}
+    for item in items:
+        if item[key] in by_key:
+            stats.duplicates += 1
+        by_key[item[key]] = item
+    return by_key
+
+
+async def backfill_hashes(session, batch_size=IN_BATCH_SIZE):
+    """Обчислення content_hash для питань, доданих до появи імпорту"""
+    while True:
+        result = await session.execute(
+            select(Question.id, Question.category, Question.text)
+            .filter(Question.content_hash.is_(None))
+            .limit(batch_size)
+        )
+        rows = result.all()
+        if not rows:
+            return
+        await session.execute(
+            update(Question).where(Question.id == bindparam('qid')),
+            [{'qid': row.id, 'content_hash': content_hash(row.category, row.text)} for row in rows]
+        )
+        await session.commit()
+
+
+async def _upsert_batch(session, questions, stats):
+    """Вставка нових та оновлення змінених питань пакету; повертає id оновлених"""
+    by_hash = unique_by(questions, 'content_hash', stats)
+
+    result = await session.execute(
+        select(Question.id, Question.content_hash, *(getattr(Question, field) for field in FIELDS))
+        .filter(Question.content_hash.in_(list(by_hash)))
+        .order_by(Question.id)
+    )
+    existing = {}
+    for row in result:
+        existing.setdefault(row.content_hash, row)
+
+    new, changed = [], []
+    for key, question in by_hash.items():
+        row = existing.get(key)
+        if row is None:
+            new.append(question)
+        elif any(getattr(row, field) != question[field] for field in FIELDS):
+            changed.append(dict(question, qid=row.id))
+        else:
+            stats.unchanged += 1
+
+    if new:
+        await session.execute(insert(Question), new)
+    if changed:
+        await session.execute(update(Question).where(Question.id == bindparam('qid')), changed)
+    stats.inserted += len(new)
+    stats.updated += len(changed)
+    return [question['qid'] for question in changed]
+
+
+async def import_questions(rows, batch_size=IN_BATCH_SIZE, dry_run=False):
+    """Імпорт пар (номер рядка, словник полів) пакетами, кожен в окремій транзакції
+
+    Пам'ять обмежена розміром пакету: дублікати між пакетами знаходяться
+    за content_hash серед уже записаних питань.
+    """
+    stats = ImportStats()
+    updated_ids = []
+
+    async for session in get_session():
+        await backfill_hashes(session, batch_size)
+        for batch in valid_batches(rows, validate_row, stats, batch_size):
+            updated_ids.extend(await _upsert_batch(session, batch, stats))
+            if dry_run:
+                await session.rollback()
+            else:
+                await session.commit()
+
+    if not dry_run and (stats.inserted or stats.updated):
+        # Нові питання не мають варіантів, тому їхні категорії теж будуть перераховані
+        await refresh_distractors(updated_ids)
+        # Запущені боти перезавантажать знімок банку питань
+        async for session in get_session():
+            await bump_version(session)
+            await session.commit()
+    return stats
+
+
+async def export_questions(path, fmt=None, category=None, batch_size=IN_BATCH_SIZE):
+    """Потоковий експорт питань у CSV або JSONL; повертає кількість питань"""
+    fmt = detect_format(path, fmt)
+    query = select(*(getattr(Question, field) for field in FIELDS)).order_by(Question.id)
+    if category:
+        query = query.filter(Question.category == category)
+
+    count = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = None
+        if fmt == 'csv':
+            writer = csv.writer(f)
+            writer.writerow(FIELDS)
+        async for session in get_session():
+            result = await session.stream(query.execution_options(yield_per=batch_size))
+            async for partition in result.partitions(batch_size):
+                for row in partition:
+                    values = [value or '' for value in row]
+                    if writer:
+                        writer.writerow(values)
+                    else:
+                        f.write(json.dumps(dict(zip(FIELDS, values)), ensure_ascii=False) + '\n')
+                count += len(partition)
+    return count
+
+
+async def _run(args):
+    await init_db()
+    try:
+        if args.command == 'import':
+            stats = await import_questions(read_rows(args.path, args.format), args.batch_size, args.dry_run)
+            print(f"Імпорт {args.path}{' (перевірка)' if args.dry_run else ''}: {stats}")
+            for error in stats.errors:
+                print(f"  {error}")
+        else:
+            count = await export_questions(args.path, args.format, args.category, args.batch_size)
+            print(f"Експортовано питань: {count} у {args.path}")
+    finally:
+        await close_db()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Імпорт та експорт бази питань (CSV/JSONL)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = subparsers.add_parser('import', help="імпорт питань з файлу")
+    import_parser.add_argument('path')
+    import_parser.add_argument('--dry-run', action='store_true', help="лише перевірити файл, нічого не записуючи")
+
+    export_parser = subparsers.add_parser('export', help="експорт питань у файл")
+    export_parser.add_argument('path')
+    export_parser.add_argument('--category', help="експортувати лише одну категорію")
+
+    for subparser in (import_parser, export_parser):
+        subparser.add_argument('--format', choices=('csv', 'jsonl'), help="за замовчуванням - за розширенням файлу")
+        subparser.add_argument('--batch-size', type=int, default=IN_BATCH_SIZE)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(_run(args))
+
+
+if __name__ == '__main__':
+    main()
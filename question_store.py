@@ -0,0 +1,148 @@
+import asyncio
+import hashlib
+import hmac
+import logging
+import random
+
+from sqlalchemy import select
+from telegram import InlineKeyboardButton
+
+import config
+from daily_sets import pick_balanced
+from data_versions import VersionWatcher, get_version
+from database import get_session
+from distractors import get_distractors
+from models import Question
+
+logger = logging.getLogger(__name__)
+
+# Ключ перестановки варіантів: без токена бота порядок кнопок не відновити з callback_data
+_ORDER_KEY = (config.TOKEN or '').encode()
+
+
+class QuestionRecord:
+    """Питання банку лише для читання з готовими кнопками та текстами відповідей"""
+
+    __slots__ = (
+        'id', 'category', 'text', 'correct_answer', 'explanation', 'options',
+        'explain_button', 'wrong_reply', 'explanation_reply'
+    )
+
+    def __init__(self, id, category, text, correct_answer, explanation, distractors):
+        self.id = id
+        self.category = category
+        self.text = text
+        self.correct_answer = correct_answer
+        self.explanation = explanation
+        # Варіант 0 - правильна відповідь, 1..N - заздалегідь підібрані неправильні
+        self.options = (correct_answer, *distractors)
+        self.explain_button = InlineKeyboardButton("Показати пояснення", callback_data=f'explain_{id}')
+        self.wrong_reply = f"Неправильно. Правильна відповідь: {correct_answer}\nПояснення: {explanation}"
+        self.explanation_reply = f"Пояснення: {explanation}"
+
+    def option_order(self, telegram_id, stamp):
+        """Індекси options у порядку кнопок повідомлення для користувача на добу stamp (date.toordinal())
+
+        Перестановка задається підписом користувача, питання та доби, тому сервер відновлює її
+        без збереження, а з callback_data не видно, яка кнопка правильна.
+        """
+        message = f'{telegram_id}:{self.id}:{stamp}'.encode()
+        order = list(range(len(self.options)))
+        random.Random(hmac.new(_ORDER_KEY, message, hashlib.sha256).digest()).shuffle(order)
+        return order
+
+    def option_at(self, telegram_id, stamp, position):
+        """Індекс варіанта за позицією натиснутої кнопки (-1 - такої кнопки немає)"""
+        order = self.option_order(telegram_id, stamp)
+        return order[position] if 0 <= position < len(order) else -1
+
+    def keyboard(self, telegram_id, day):
+        """Кнопки питання для користувача: callback_data answer_<id>_<позиція>_<доба>"""
+        stamp = day.toordinal()
+        keyboard = [
+            [InlineKeyboardButton(self.options[k], callback_data=f'answer_{self.id}_{position}_{stamp}')]
+            for position, k in enumerate(self.option_order(telegram_id, stamp))
+        ]
+        keyboard.append([self.explain_button])
+        return keyboard
+
+
+class Snapshot:
+    __slots__ = ('version', 'by_id', 'by_category')
+
+    def __init__(self, version=0, by_id=None, by_category=None):
+        self.version = version
+        self.by_id = by_id or {}
+        self.by_category = by_category or {}
+
+
+class QuestionStore(VersionWatcher):
+    """Знімок банку питань у пам'яті: читання без запитів до бази
+
+    Знімок завантажується цілком і замінюється одним присвоєнням, тому читачі
+    завжди бачать узгоджений стан; знімок перезавантажується при зміні версії банку питань.
+    """
+
+    description = "банку питань"
+
+    def __init__(self):
+        super().__init__()
+        self._snapshot = Snapshot()
+        self._reload_lock = None
+
+    @property
+    def version(self):
+        return self._snapshot.version
+
+    def __len__(self):
+        return len(self._snapshot.by_id)
+
+    def get(self, question_id):
+        return self._snapshot.by_id.get(question_id)
+
+    def get_many(self, question_ids):
+        """Питання за id у заданому порядку (відсутні пропускаються)"""
+        by_id = self._snapshot.by_id
+        return [by_id[i] for i in question_ids if i in by_id]
+
+    def category_index(self):
+        """Ідентифікатори питань за категоріями: {категорія: (id, ...)}"""
+        return self._snapshot.by_category
+
+    def pick(self, size, rng=random):
+        """Випадкові питання з балансом категорій"""
+        return self.get_many(pick_balanced(self._snapshot.by_category, size, rng))
+
+    async def load(self):
+        """Повне завантаження банку питань і варіантів відповідей"""
+        if self._reload_lock is None:
+            self._reload_lock = asyncio.Lock()
+        async with self._reload_lock:
+            async for session in get_session():
+                version = await get_version(session)
+                result = await session.execute(
+                    select(Question.id, Question.category, Question.text, Question.correct_answer, Question.explanation)
+                    .order_by(Question.id)
+                )
+                rows = result.all()
+            distractors = await get_distractors()
+
+            by_id = {}
+            by_category = {}
+            for id_, category, text, correct_answer, explanation in rows:
+                by_id[id_] = QuestionRecord(id_, category, text, correct_answer, explanation, distractors.get(id_, ()))
+                by_category.setdefault(category, []).append(id_)
+            self._snapshot = Snapshot(version, by_id, {c: tuple(ids) for c, ids in by_category.items()})
+        logger.info(f"Завантажено питань: {len(by_id)} (версія {version})")
+
+    async def check(self):
+        """Перезавантаження знімка, якщо версія банку питань у базі змінилася"""
+        async for session in get_session():
+            version = await get_version(session)
+        if version != self._snapshot.version:
+            await self.load()
+            return True
+        return False
+
+
+question_store = QuestionStore()
@@ -0,0 +1,255 @@
+import argparse
+import asyncio
+import csv
+import gzip
+import logging
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, delete, select, update
+
+import config
+from analytics import ARCHIVE_MARKER, archived_before, rebuild_rollups
+from answer_writer import parse_answer
+from database import IN_BATCH_SIZE, close_db, engine, get_session, init_db
+from models import JobRun, UserAnswer
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 5000
+# Пауза між пакетами, щоб запис відповідей і обробники не чекали на базу
+BATCH_PAUSE = 0.05
+# Рейтинг за тиждень завантажується з user_answers, тому свіжі відповіді не архівуються
+MIN_RETENTION_DAYS = 14
+# Сторінок, що повертаються за один крок incremental_vacuum у нічній задачі бота
+VACUUM_STEP_PAGES = 1000
+ARCHIVE_FIELDS = ('id', 'user_id', 'question_id', 'answer_code', 'is_correct', 'answered_at')
+
+
+class RetentionStats:
+    """Підсумки обслуговування історії відповідей"""
+
+    def __init__(self):
+        self.compacted = 0
+        self.archived = 0
+        self.files = set()
+        # 'full', 'incremental' або None
+        self.vacuumed = None
+
+    def __str__(self):
+        vacuumed = {'full': 'так', 'incremental': 'поступовий'}.get(self.vacuumed, 'ні')
+        return (
+            f"стиснуто: {self.compacted}, в архіві: {self.archived}, файлів: {len(self.files)}, "
+            f"VACUUM: {vacuumed}"
+        )
+
+
+async def compact_answers(batch_size=BATCH_SIZE, stats=None):
+    """Заміна рядків callback_data старих записів на answer_code, пакетами за id
+
+    Нові відповіді зберігають лише answer_code, тому це разове перетворення старої історії;
+    прохід читає всю таблицю, і запускається лише з командного рядка.
+    """
+    stats = stats or RetentionStats()
+    last_id = 0
+    while True:
+        async for session in get_session():
+            result = await session.execute(
+                select(UserAnswer.id, UserAnswer.answer)
+                .filter(UserAnswer.id > last_id, UserAnswer.answer.isnot(None))
+                .order_by(UserAnswer.id)
+                .limit(batch_size)
+            )
+            rows = result.all()
+            if rows:
+                await session.execute(
+                    update(UserAnswer.__table__)
+                    .where(UserAnswer.__table__.c.id == bindparam('aid'))
+                    .values(answer_code=bindparam('code'), answer=None),
+                    [{'aid': row.id, 'code': parse_answer(row.answer)} for row in rows]
+                )
+                await session.commit()
+        if not rows:
+            return stats
+        stats.compacted += len(rows)
+        last_id = rows[-1].id
+        await asyncio.sleep(BATCH_PAUSE)
+
+
+def _append_archive(archive_dir, rows, stats):
+    """Дописування відповідей у помісячні файли user_answers_YYYY-MM.csv.gz"""
+    os.makedirs(archive_dir, exist_ok=True)
+    by_month = {}
+    for row in rows:
+        by_month.setdefault(f"{row.answered_at:%Y-%m}", []).append(row)
+    for month, month_rows in by_month.items():
+        path = os.path.join(archive_dir, f"user_answers_{month}.csv.gz")
+        new_file = not os.path.exists(path)
+        # Дописаний gzip-потік - коректний файл gzip з кількох частин
+        with gzip.open(path, 'at', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(ARCHIVE_FIELDS)
+            writer.writerows(
+                (row.id, row.user_id, row.question_id,
+                 row.answer_code if row.answer_code is not None else parse_answer(row.answer),
+                 int(bool(row.is_correct)), row.answered_at.isoformat(sep=' '))
+                for row in month_rows
+            )
+        stats.files.add(path)
+
+
+async def _mark_archived(cutoff):
+    async for session in get_session():
+        marker = await session.get(JobRun, ARCHIVE_MARKER)
+        if marker is None:
+            marker = JobRun(job_id=ARCHIVE_MARKER)
+            session.add(marker)
+        marker.run_date = cutoff
+        marker.run_at = datetime.utcnow()
+        await session.commit()
+
+
+async def archive_answers(retention_days, archive_dir, batch_size=BATCH_SIZE, stats=None):
+    """Перенесення відповідей, старших за retention_days днів, у стиснуті помісячні файли
+
+    Щоденні підсумки аналітики вже містять ці відповіді (перед першим архівуванням
+    вони перераховуються), тому звіти не змінюються. Файл дописується до видалення
+    рядків, тож збій посеред пакету дає дублікат в архіві (з тим самим id), а не втрату.
+    """
+    stats = stats or RetentionStats()
+    retention_days = max(retention_days, MIN_RETENTION_DAYS)
+    cutoff = datetime.utcnow().date() - timedelta(days=retention_days)
+    async for session in get_session():
+        previous = await archived_before(session)
+    if previous is None:
+        logger.info("Перше архівування: перерахунок щоденних підсумків з усієї історії")
+        await rebuild_rollups()
+    if previous is None or previous < cutoff:
+        await _mark_archived(cutoff)
+
+    cutoff_at = datetime.combine(cutoff, datetime.min.time())
+    while True:
+        async for session in get_session():
+            result = await session.execute(
+                select(UserAnswer.id, UserAnswer.user_id, UserAnswer.question_id, UserAnswer.answer,
+                       UserAnswer.answer_code, UserAnswer.is_correct, UserAnswer.answered_at)
+                .filter(UserAnswer.answered_at < cutoff_at)
+                .order_by(UserAnswer.answered_at)
+                .limit(batch_size)
+            )
+            rows = result.all()
+        if not rows:
+            return stats
+        await asyncio.to_thread(_append_archive, archive_dir, rows, stats)
+        ids = [row.id for row in rows]
+        async for session in get_session():
+            for start in range(0, len(ids), IN_BATCH_SIZE):
+                await session.execute(delete(UserAnswer).filter(UserAnswer.id.in_(ids[start:start + IN_BATCH_SIZE])))
+            await session.commit()
+        stats.archived += len(rows)
+        await asyncio.sleep(BATCH_PAUSE)
+
+
+async def _incremental_vacuum(conn, free_pages):
+    """Повернення вільних сторінок частинами: кожен крок коротко блокує запис"""
+    raw = await conn.get_raw_connection()
+    while free_pages > 0:
+        # Через sqlite3 execute() виконує лише один крок прагми (одну сторінку), executescript - усю
+        await raw.driver_connection.executescript(f"PRAGMA incremental_vacuum({VACUUM_STEP_PAGES})")
+        left = (await conn.exec_driver_sql("PRAGMA freelist_count")).scalar()
+        if left >= free_pages:
+            return
+        free_pages = left
+        await asyncio.sleep(BATCH_PAUSE)
+
+
+async def maintain_database(vacuum_ratio=0.2, force_vacuum=False, full_vacuum=True):
+    """Оновлення статистики планувальника та звільнення місця, якщо вільні сторінки займають
+    vacuum_ratio файлу SQLite
+
+    Повний VACUUM блокує весь запис на час перебудови файлу, тому без full_vacuum (нічна
+    задача бота) місце повертається лише поступово через incremental_vacuum у базі з
+    auto_vacuum=INCREMENTAL; повний VACUUM з командного рядка вмикає цей режим.
+    Повертає 'full', 'incremental' або None. Для PostgreSQL місце звільняє autovacuum.
+    """
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level='AUTOCOMMIT')
+        if engine.dialect.name != 'sqlite':
+            await conn.exec_driver_sql(f"ANALYZE {UserAnswer.__tablename__}")
+            return None
+        page_count = (await conn.exec_driver_sql("PRAGMA page_count")).scalar()
+        free_pages = (await conn.exec_driver_sql("PRAGMA freelist_count")).scalar()
+        vacuumed = None
+        if force_vacuum or (page_count and free_pages / page_count >= vacuum_ratio):
+            if full_vacuum:
+                logger.info(f"VACUUM: вільних сторінок {free_pages} з {page_count}")
+                await conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+                await conn.exec_driver_sql("VACUUM")
+                # У режимі WAL VACUUM проходить через журнал - повертаємо місце і звідти
+                await conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+                vacuumed = 'full'
+            elif (await conn.exec_driver_sql("PRAGMA auto_vacuum")).scalar() == 2:
+                await _incremental_vacuum(conn, free_pages)
+                vacuumed = 'incremental'
+            else:
+                logger.info(
+                    f"Вільних сторінок {free_pages} з {page_count}: для звільнення місця виконайте "
+                    "python retention.py vacuum"
+                )
+        if full_vacuum:
+            await conn.exec_driver_sql("ANALYZE")
+        else:
+            # Аналізує лише таблиці, статистика яких застаріла
+            await conn.exec_driver_sql("PRAGMA optimize")
+    return vacuumed
+
+
+async def run_retention(retention_days=None, archive_dir=None, maintenance=False):
+    """Обслуговування історії: архівування старих відповідей і звільнення місця
+
+    Нічна задача бота лише переносить відповіді в архів пакетами за індексом answered_at
+    і повертає місце поступово. З maintenance (командний рядок) також стискаються старі
+    записи повним проходом таблиці та виконується повний VACUUM/ANALYZE.
+    """
+    retention_days = config.ANSWER_RETENTION_DAYS if retention_days is None else retention_days
+    stats = RetentionStats()
+    if maintenance:
+        await compact_answers(stats=stats)
+    if retention_days > 0:
+        await archive_answers(retention_days, archive_dir or config.ANSWER_ARCHIVE_DIR, stats=stats)
+    stats.vacuumed = await maintain_database(config.VACUUM_FREE_RATIO, full_vacuum=maintenance)
+    logger.info(f"Обслуговування історії відповідей завершено: {stats}")
+    return stats
+
+
+async def _run(args):
+    await init_db()
+    try:
+        if args.command == 'vacuum':
+            await maintain_database(force_vacuum=True)
+            print("VACUUM та ANALYZE виконано")
+            return
+        stats = await run_retention(args.days, args.archive_dir, maintenance=True)
+        print(f"Обслуговування історії відповідей: {stats}")
+    finally:
+        await close_db()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Стиснення та архівування історії відповідей (user_answers)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="стиснення, архівування старих відповідей, VACUUM/ANALYZE")
+    run_parser.add_argument('--days', type=int, help="зберігати в базі відповіді за останні N днів (0 - не архівувати)")
+    run_parser.add_argument('--archive-dir', help="каталог архіву (за замовчуванням - ANSWER_ARCHIVE_DIR)")
+
+    subparsers.add_parser('vacuum', help="примусовий VACUUM та ANALYZE")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_run(args))
+
+
+if __name__ == '__main__':
+    main()
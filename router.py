@@ -0,0 +1,93 @@
+import logging
+import time
+
+from metrics import current_route, handler_errors, handler_latency
+
+logger = logging.getLogger(__name__)
+
+
+class Router:
+    """Єдина точка входу для тексту та callback-запитів з вибором обробника за словником
+
+    Порядок для тексту: активний крок майстра (wizard) - кнопка меню - стан
+    очікування вводу (state); кнопка меню скасовує очікування вводу. Callback-запити маршрутизуються за префіксом
+    callback_data до першого '_'. Для кожного маршруту ведеться гістограма затримок
+    (metrics.handler_latency), а запити до бази під час обробки обліковуються за маршрутом.
+    """
+
+    def __init__(self):
+        self.wizards = {}
+        self.texts = {}
+        self.states = {}
+        self.callbacks = {}
+
+    def wizard(self, key, handler):
+        """Обробник усіх повідомлень, поки в user_data є непорожній key (покрокові сценарії)"""
+        self.wizards[key] = handler
+
+    def text(self, text, handler):
+        """Обробник кнопки меню з точним текстом"""
+        self.texts[text] = handler
+
+    def state(self, value, handler, key='state'):
+        """Обробник довільного тексту, коли user_data[key] == value"""
+        self.states.setdefault(key, {})[value] = handler
+
+    def callback(self, prefix, handler):
+        """Обробник callback_data виду '<prefix>_...' (або рівно '<prefix>')"""
+        self.callbacks[prefix] = handler
+
+    def _resolve_text(self, text, user_data):
+        for key, handler in self.wizards.items():
+            if user_data.get(key):
+                return handler
+        handler = self.texts.get(text)
+        if handler is not None:
+            for key in self.states:
+                user_data.pop(key, None)
+            return handler
+        for key, handlers in self.states.items():
+            handler = handlers.get(user_data.get(key))
+            if handler is not None:
+                return handler
+        return None
+
+    async def _dispatch(self, handler, update, context):
+        name = handler.__name__
+        token = current_route.set(name)
+        started = time.perf_counter()
+        try:
+            await handler(update, context)
+        except Exception:
+            handler_errors.labels(name).inc()
+            raise
+        finally:
+            handler_latency.labels(name).observe(time.perf_counter() - started)
+            current_route.reset(token)
+
+    async def handle_message(self, update, context):
+        handler = self._resolve_text(update.message.text, context.user_data)
+        if handler is None:
+            logger.debug(f"Немає маршруту для повідомлення від {update.effective_user.id}")
+            return
+        await self._dispatch(handler, update, context)
+
+    async def handle_callback(self, update, context):
+        query = update.callback_query
+        handler = self.callbacks.get((query.data or '').split('_', 1)[0])
+        if handler is None:
+            logger.warning(f"Невідомий callback: {query.data}")
+            await query.answer()
+            return
+        await self._dispatch(handler, update, context)
+
+    def summary(self):
+        """Кількість викликів та p50/p99 затримки по маршрутах"""
+        lines = []
+        for (name,), histogram in sorted(handler_latency.children.items()):
+            p50, p99 = histogram.quantile(0.5), histogram.quantile(0.99)
+            lines.append(
+                f"{name}: {histogram.count} викликів, середнє {histogram.sum / histogram.count * 1000:.1f} мс, "
+                f"p50 ≤ {p50 * 1000:.0f} мс, p99 ≤ {p99 * 1000:.0f} мс"
+            )
+        return "\n".join(lines)
@@ -1,5 +1,6 @@
 from models import Question
 from database import get_session
+from question_bank import import_questions
 from sqlalchemy import select
 
 SAMPLE_QUESTIONS = [
@@ -41,15 +42,12 @@ SAMPLE_QUESTIONS = [
 ]
 
 async def add_sample_questions():
-    """Додавання прикладів питань до бази даних"""
+    """Додавання прикладів питань до порожньої бази даних"""
     async for session in get_session():
         # Перевірка чи вже є питання
-        existing = await session.execute(select(Question))
-        if existing.scalar_one_or_none():
+        existing = await session.execute(select(Question.id).limit(1))
+        if existing.first():
             return
-            
-        # Додавання питань
-        for q in SAMPLE_QUESTIONS:
-            question = Question(**q)
-            session.add(question)
-        await session.commit() 
\ No newline at end of file
+
+    # Імпорт пропускає дублікати та підбирає неправильні варіанти для нових питань
+    await import_questions(enumerate(SAMPLE_QUESTIONS, 1))
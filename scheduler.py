@@ -0,0 +1,224 @@
+import logging
+from datetime import datetime, timedelta
+
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.util import astimezone
+from sqlalchemy import or_, select, update
+
+import config
+from answer_writer import answer_writer
+from database import dialect_insert, get_session
+from models import Establishment, JobRun, User
+from retention import run_retention
+from user_cache import user_cache
+from user_directory import name_key
+
+logger = logging.getLogger(__name__)
+
+
+def parse_establishment_timezones(value):
+    """Розбір рядка 'Заклад=Europe/Warsaw;Інший заклад=Europe/Kyiv' у словник"""
+    timezones = {}
+    for item in (value or '').split(';'):
+        if '=' in item:
+            establishment, timezone = item.split('=', 1)
+            timezones[establishment.strip()] = timezone.strip()
+    return timezones
+
+
+def establishment_groups(default_timezone=None, establishment_timezones=None):
+    """Групи користувачів за часовим поясом закладу: список (пояс, [умови на User])"""
+    default_timezone = default_timezone or config.TIMEZONE
+    if establishment_timezones is None:
+        establishment_timezones = parse_establishment_timezones(config.ESTABLISHMENT_TIMEZONES)
+
+    by_timezone = {}
+    for establishment, timezone in establishment_timezones.items():
+        if timezone != default_timezone:
+            by_timezone.setdefault(timezone, []).append(establishment)
+
+    def establishment_ids(establishments):
+        # Умова за індексованим users.establishment_id; назви шукаються в довіднику закладів
+        keys = [name_key(establishment) for establishment in establishments]
+        return select(Establishment.id).filter(Establishment.key.in_(keys)).scalar_subquery()
+
+    mapped = [e for establishments in by_timezone.values() for e in establishments]
+    # Заклади без окремого поясу (та користувачі без закладу) отримують пояс за замовчуванням
+    groups = [(default_timezone, [
+        or_(User.establishment_id.is_(None), User.establishment_id.notin_(establishment_ids(mapped)))
+    ] if mapped else [])]
+    groups.extend(
+        (timezone, [User.establishment_id.in_(establishment_ids(establishments))])
+        for timezone, establishments in by_timezone.items()
+    )
+    return groups
+
+
+def send_slots(hour, minute, window, slots):
+    """Час старту кожного слоту розсилки, рівномірно розподілений у вікні window хвилин"""
+    slots = max(1, slots)
+    step = window / slots
+    start = hour * 60 + minute
+    return [divmod(int(start + step * slot) % (24 * 60), 60) for slot in range(slots)]
+
+
+class DailyScheduler:
+    """Щоденні задачі на циклі подій бота з пропуском повторів та наздоганянням пропущених запусків
+
+    Запуск на день захоплюється в job_runs одним умовним UPDATE, тому задача виконується
+    не більше одного разу на добу навіть після перезапуску чи з кількома процесами бота.
+    Дата запуску фіксується лише після успішного виконання: задача з помилкою повторюється
+    через retry_delay секунд (до max_attempts спроб). Запуски, пропущені під час простою
+    (у межах misfire_grace секунд), після старту відтворюються з тими самими інтервалами між ними.
+    """
+
+    def __init__(self, misfire_grace=3600, retry_delay=300, max_attempts=3):
+        self.misfire_grace = misfire_grace
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+        self.scheduler = AsyncIOScheduler(timezone=astimezone(config.TIMEZONE))
+        self._jobs = {}
+
+    def add_daily(self, job_id, func, hour, minute, timezone):
+        """Щоденна задача func() о hour:minute за поясом timezone"""
+        timezone = astimezone(timezone)
+        self._jobs[job_id] = (func, hour, minute, timezone)
+        self.scheduler.add_job(
+            self._run, CronTrigger(hour=hour, minute=minute, timezone=timezone),
+            args=[job_id], id=job_id, replace_existing=True,
+            coalesce=True, max_instances=1, misfire_grace_time=self.misfire_grace
+        )
+
+    def _run_later(self, job_id, delay, suffix, attempt=1):
+        self.scheduler.add_job(
+            self._run, 'date', run_date=datetime.now(self._jobs[job_id][3]) + timedelta(seconds=delay),
+            args=[job_id, attempt], id=f'{job_id}_{suffix}', replace_existing=True,
+            misfire_grace_time=self.misfire_grace
+        )
+
+    async def _last_run_date(self, job_id):
+        async for session in get_session():
+            result = await session.execute(select(JobRun.run_date).filter(JobRun.job_id == job_id))
+            run_date = result.scalar_one_or_none()
+        return run_date
+
+    async def _claim(self, job_id, today):
+        """Захоплення запуску на today: True, якщо задачу виконує цей процес
+
+        Захоплення іншого процесу, старше misfire_grace секунд, вважається залишеним після збою.
+        """
+        now = datetime.utcnow()
+        async for session in get_session():
+            await session.execute(
+                dialect_insert(JobRun).values(job_id=job_id).on_conflict_do_nothing(index_elements=['job_id'])
+            )
+            result = await session.execute(
+                update(JobRun)
+                .filter(
+                    JobRun.job_id == job_id,
+                    or_(JobRun.run_date.is_(None), JobRun.run_date < today),
+                    or_(JobRun.claimed_at.is_(None), JobRun.claimed_at < now - timedelta(seconds=self.misfire_grace))
+                )
+                .values(claimed_at=now)
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+        return result.rowcount == 1
+
+    async def _finish(self, job_id, run_date=None):
+        """Зняття захоплення; з run_date - позначка успішного запуску"""
+        values = {'claimed_at': None}
+        if run_date is not None:
+            values.update(run_date=run_date, run_at=datetime.utcnow())
+        async for session in get_session():
+            await session.execute(
+                update(JobRun).filter(JobRun.job_id == job_id).values(**values)
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+
+    async def _run(self, job_id, attempt=1):
+        func, _, _, timezone = self._jobs[job_id]
+        today = datetime.now(timezone).date()
+        if not await self._claim(job_id, today):
+            logger.info(f"Задача {job_id} вже виконана сьогодні або виконується іншим процесом")
+            return
+        logger.info(f"Запуск задачі {job_id}" + (f" (спроба {attempt})" if attempt > 1 else ""))
+        try:
+            await func()
+        except Exception as e:
+            logger.error(f"Помилка у задачі {job_id}: {e}")
+            await self._finish(job_id)
+            if attempt < self.max_attempts:
+                self._run_later(job_id, self.retry_delay, 'retry', attempt + 1)
+            return
+        await self._finish(job_id, today)
+
+    async def _catch_up(self):
+        """Запуск задач, час яких сьогодні минув під час простою бота
+
+        Пропущені запуски зсуваються на поточний момент зі збереженням інтервалів між ними,
+        щоб слоти розсилки не стартували одночасно.
+        """
+        missed = []
+        for job_id, (_, hour, minute, timezone) in self._jobs.items():
+            now = datetime.now(timezone)
+            scheduled = timezone.localize(datetime(now.year, now.month, now.day, hour, minute))
+            if not scheduled <= now <= scheduled + timedelta(seconds=self.misfire_grace):
+                continue
+            last_run = await self._last_run_date(job_id)
+            if last_run is None or last_run < now.date():
+                missed.append((scheduled, job_id))
+        if not missed:
+            return
+        first = min(scheduled for scheduled, _ in missed)
+        for scheduled, job_id in sorted(missed):
+            delay = (scheduled - first).total_seconds()
+            logger.info(f"Наздоганяння пропущеного запуску {job_id} через {delay:.0f} с")
+            self._run_later(job_id, delay, 'catch_up')
+
+    async def start(self):
+        self.scheduler.start()
+        await self._catch_up()
+
+    def shutdown(self):
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+
+
+async def reset_daily_scores(*criteria):
+    """Обнулення щоденного рахунку користувачів (з урахуванням умов на User)"""
+    # Спершу записуємо буферизовані прирости, щоб вони не потрапили в новий день
+    await answer_writer.flush()
+    async for session in get_session():
+        await session.execute(
+            update(User).filter(*criteria).values(daily_score=0).execution_options(synchronize_session=False)
+        )
+        await session.commit()
+    user_cache.clear()
+
+
+def setup_daily_jobs(scheduler, send_daily_questions):
+    """Розсилка питань слотами у вікні та опівнічне обнулення для кожного часового поясу,
+    нічне архівування історії відповідей (якщо задано ANSWER_RETENTION_DAYS)
+
+    send_daily_questions(*criteria) - корутина розсилки для користувачів, що відповідають умовам.
+    """
+    slots = send_slots(config.DAILY_QUESTION_HOUR, config.DAILY_QUESTION_MINUTE,
+                       config.DAILY_SEND_WINDOW, config.DAILY_SEND_SLOTS)
+    for timezone, criteria in establishment_groups():
+        scheduler.add_daily(
+            f'reset_daily_scores:{timezone}',
+            lambda criteria=criteria: reset_daily_scores(*criteria),
+            0, 0, timezone
+        )
+        for slot, (hour, minute) in enumerate(slots):
+            slot_criteria = criteria + [User.id % len(slots) == slot] if len(slots) > 1 else criteria
+            scheduler.add_daily(
+                f'daily_questions:{timezone}:{slot}',
+                lambda slot_criteria=slot_criteria: send_daily_questions(*slot_criteria),
+                hour, minute, timezone
+            )
+    if config.ANSWER_RETENTION_DAYS > 0:
+        scheduler.add_daily('answer_retention', run_retention, config.RETENTION_HOUR, 0, config.TIMEZONE)
@@ -0,0 +1,131 @@
+from datetime import timedelta
+
+from sqlalchemy import bindparam, func, insert, select, tuple_, update
+
+from database import IN_BATCH_SIZE
+from models import QuestionProgress
+
+# Інтервали (у днях) для кожної коробки Лейтнера: правильна відповідь переносить
+# питання в наступну коробку, помилка повертає в першу
+INTERVALS = (1, 2, 4, 7, 14, 30, 60)
+# Пар (користувач, питання) в одному запиті: по два параметри на пару
+PAIRS_PER_QUERY = IN_BATCH_SIZE // 2
+
+
+def next_state(box, is_correct):
+    """Нова коробка та інтервал до наступного повторення"""
+    box = min(box + 1, len(INTERVALS) - 1) if is_correct else 0
+    return box, INTERVALS[box]
+
+
+async def record_answers(session, answers):
+    """Оновлення стану повторення за пакетом відповідей у поточній транзакції
+
+    answers - словники з user_id, question_id, is_correct, answered_at у порядку надходження.
+    """
+    if not answers:
+        return
+    # Читаються лише пари пакету, частинами, щоб список IN не перевищував ліміт параметрів
+    pairs = list({(a['user_id'], a['question_id']) for a in answers})
+    existing = {}
+    for start in range(0, len(pairs), PAIRS_PER_QUERY):
+        result = await session.execute(
+            select(QuestionProgress.user_id, QuestionProgress.question_id, QuestionProgress.box,
+                   QuestionProgress.reps, QuestionProgress.lapses)
+            .filter(
+                tuple_(QuestionProgress.user_id, QuestionProgress.question_id).in_(pairs[start:start + PAIRS_PER_QUERY])
+            )
+        )
+        existing.update({(row.user_id, row.question_id): row for row in result})
+
+    states = {}
+    for answer in answers:
+        key = (answer['user_id'], answer['question_id'])
+        if key in states:
+            box, reps, lapses = states[key]['box'], states[key]['reps'], states[key]['lapses']
+        elif key in existing:
+            row = existing[key]
+            box, reps, lapses = row.box or 0, row.reps or 0, row.lapses or 0
+        else:
+            # Нове питання: перша правильна відповідь кладе його в коробку 0
+            box, reps, lapses = -1, 0, 0
+        box, interval = next_state(box, answer['is_correct'])
+        states[key] = {
+            'box': box,
+            'due': answer['answered_at'].date() + timedelta(days=interval),
+            'reps': reps + 1,
+            'lapses': lapses + (0 if answer['is_correct'] else 1),
+            'last_answered_at': answer['answered_at'],
+        }
+
+    new_rows = [
+        {'user_id': user_id, 'question_id': question_id, **state}
+        for (user_id, question_id), state in states.items() if (user_id, question_id) not in existing
+    ]
+    changed_rows = [
+        {'uid': user_id, 'qid': question_id, **state}
+        for (user_id, question_id), state in states.items() if (user_id, question_id) in existing
+    ]
+    if new_rows:
+        await session.execute(insert(QuestionProgress), new_rows)
+    if changed_rows:
+        await session.execute(
+            update(QuestionProgress)
+            .where(QuestionProgress.user_id == bindparam('uid'), QuestionProgress.question_id == bindparam('qid'))
+            .values(
+                box=bindparam('box'),
+                due=bindparam('due'),
+                reps=bindparam('reps'),
+                lapses=bindparam('lapses'),
+                last_answered_at=bindparam('last_answered_at')
+            )
+            .execution_options(synchronize_session=False),
+            changed_rows
+        )
+
+
+async def due_questions(session, first_user_id, last_user_id, day, limit):
+    """Питання до повторення для діапазону користувачів: {user_id: [question_id, ...]}
+
+    Читається лише черга прострочених записів за індексом (user_id, due),
+    не більше limit на користувача.
+    """
+    position = func.row_number().over(
+        partition_by=QuestionProgress.user_id,
+        order_by=(QuestionProgress.due, QuestionProgress.box)
+    ).label('position')
+    queue = (
+        select(QuestionProgress.user_id, QuestionProgress.question_id, position)
+        .filter(QuestionProgress.user_id.between(first_user_id, last_user_id), QuestionProgress.due <= day)
+        .subquery()
+    )
+    result = await session.execute(
+        select(queue.c.user_id, queue.c.question_id)
+        .filter(queue.c.position <= limit)
+        .order_by(queue.c.user_id, queue.c.position)
+    )
+    due = {}
+    for user_id, question_id in result:
+        due.setdefault(user_id, []).append(question_id)
+    return due
+
+
+async def scheduled_questions(session, candidates, day):
+    """Які з питань-кандидатів ще не час повторювати: {user_id: {question_id, ...}}
+
+    candidates - {user_id: [question_id, ...]}. Перевіряються лише пари-кандидати за
+    первинним ключем (user_id, question_id), а не всі вивчені користувачем питання.
+    """
+    pairs = [(user_id, question_id) for user_id, question_ids in candidates.items() for question_id in question_ids]
+    scheduled = {}
+    for start in range(0, len(pairs), PAIRS_PER_QUERY):
+        result = await session.execute(
+            select(QuestionProgress.user_id, QuestionProgress.question_id)
+            .filter(
+                tuple_(QuestionProgress.user_id, QuestionProgress.question_id).in_(pairs[start:start + PAIRS_PER_QUERY]),
+                QuestionProgress.due > day
+            )
+        )
+        for user_id, question_id in result:
+            scheduled.setdefault(user_id, set()).add(question_id)
+    return scheduled
@@ -0,0 +1,86 @@
+import time
+from collections import OrderedDict
+
+from sqlalchemy import select
+
+import config
+from database import get_session
+from metrics import registry, user_cache_evictions, user_cache_hits, user_cache_misses
+from models import User
+
+_MISSING = object()
+
+
+class UserCache:
+    """LRU-кеш рядків User за telegram_id з обмеженим часом життя записів
+
+    Закешовані об'єкти від'єднані від сесії і призначені лише для читання:
+    зміни користувача робляться окремим UPDATE з подальшим invalidate().
+    Відсутність користувача теж кешується до реєстрації.
+    """
+
+    def __init__(self, maxsize=10000, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _lookup(self, telegram_id):
+        entry = self._entries.get(telegram_id)
+        if entry is None:
+            return _MISSING
+        expires_at, user = entry
+        if expires_at < time.monotonic():
+            del self._entries[telegram_id]
+            return _MISSING
+        self._entries.move_to_end(telegram_id)
+        return user
+
+    def put(self, telegram_id, user):
+        self._entries[telegram_id] = (time.monotonic() + self.ttl, user)
+        self._entries.move_to_end(telegram_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+            user_cache_evictions.inc()
+
+    async def get(self, telegram_id):
+        """Користувач за telegram_id або None, якщо він не зареєстрований"""
+        user = self._lookup(telegram_id)
+        if user is not _MISSING:
+            self.hits += 1
+            user_cache_hits.inc()
+            return user
+
+        self.misses += 1
+        user_cache_misses.inc()
+        async for session in get_session():
+            user = await session.execute(select(User).filter(User.telegram_id == telegram_id))
+            user = user.scalar_one_or_none()
+        self.put(telegram_id, user)
+        return user
+
+    def __len__(self):
+        return len(self._entries)
+
+    def invalidate(self, telegram_id):
+        self._entries.pop(telegram_id, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        requests = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': self.hits / requests if requests else 0.0,
+        }
+
+
+user_cache = UserCache(maxsize=config.USER_CACHE_SIZE, ttl=config.USER_CACHE_TTL)
+registry.gauge('quizkm_user_cache_size', "Користувачі в кеші", func=user_cache.__len__)
@@ -0,0 +1,217 @@
+import argparse
+import asyncio
+import logging
+
+from sqlalchemy import bindparam, insert, select, update
+
+from data_versions import USERS, VersionWatcher, bump_version, get_version
+from database import IN_BATCH_SIZE, close_db, dialect_insert, get_session, init_db
+from models import Establishment, Position, User
+from question_bank import ImportStats, batches, read_rows, unique_by, valid_batches
+from user_cache import user_cache
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('telegram_id', 'full_name', 'establishment', 'position')
+# Довідник та стовпці users (назва для відображення, id) для кожного поля файлу
+LOOKUPS = {
+    'establishment': (Establishment, 'city', 'establishment_id'),
+    'position': (Position, 'position', 'position_id'),
+}
+USER_COLUMNS = ('full_name', 'city', 'position', 'establishment_id', 'position_id')
+_APOSTROPHES = str.maketrans({'’': "'", 'ʼ': "'", '`': "'"})
+
+
+def normalize_name(value):
+    """Назва без зайвих пробілів і з єдиним апострофом"""
+    return ' '.join(str(value or '').translate(_APOSTROPHES).split())
+
+
+def name_key(value):
+    """Ключ довідника: «Заклад  №1» і «заклад №1» - той самий заклад"""
+    return normalize_name(value).casefold()
+
+
+async def lookup_ids(session, model, names):
+    """Записи довідника model за назвами у поточній транзакції, відсутні створюються
+
+    Повертає словник {name_key(назва): (id, назва в довіднику)}.
+    """
+    by_key = {name_key(name): normalize_name(name) for name in names}
+    by_key.pop('', None)
+    if not by_key:
+        return {}
+    await session.execute(
+        dialect_insert(model).on_conflict_do_nothing(index_elements=['key']),
+        [{'key': key, 'name': name} for key, name in by_key.items()]
+    )
+    result = await session.execute(select(model.key, model.id, model.name).filter(model.key.in_(list(by_key))))
+    return {key: (id_, name) for key, id_, name in result}
+
+
+async def profile_fields(session, establishment, position):
+    """Поля User для закладу та посади: назви з довідників та їх id"""
+    fields = {}
+    for field, value in (('establishment', establishment), ('position', position)):
+        model, name_column, id_column = LOOKUPS[field]
+        found = (await lookup_ids(session, model, [value])).get(name_key(value))
+        fields[id_column], fields[name_column] = found or (None, normalize_name(value) or None)
+    return fields
+
+
+async def backfill_directory(session, batch_size=IN_BATCH_SIZE):
+    """Заповнення establishment_id та position_id користувачів, зареєстрованих до появи довідників"""
+    for model, name_column, id_column in LOOKUPS.values():
+        name, foreign_key = getattr(User, name_column), getattr(User, id_column)
+        result = await session.execute(select(name).filter(foreign_key.is_(None), name.isnot(None)).distinct())
+        for values in batches(result.scalars().all(), batch_size):
+            found = await lookup_ids(session, model, values)
+            for value in values:
+                if name_key(value) in found:
+                    id_, canonical = found[name_key(value)]
+                    await session.execute(
+                        update(User).filter(name == value, foreign_key.is_(None))
+                        .values({id_column: id_, name_column: canonical})
+                    )
+            await session.commit()
+
+
+def validate_row(row):
+    """Перевірка рядка файлу співробітників; повертає словник полів або кидає ValueError"""
+    if not isinstance(row, dict):
+        raise ValueError("рядок не є об'єктом з полями")
+    user = {}
+    for field in FIELDS:
+        value = row.get(field)
+        if value is not None and not isinstance(value, (str, int)):
+            raise ValueError(f"некоректне значення поля {field}")
+        user[field] = normalize_name(value)
+    missing = [field for field in FIELDS if not user[field]]
+    if missing:
+        raise ValueError(f"порожні поля: {', '.join(missing)}")
+    try:
+        user['telegram_id'] = int(user['telegram_id'])
+    except ValueError:
+        raise ValueError(f"некоректний telegram_id: {user['telegram_id']}")
+    if user['telegram_id'] <= 0:
+        raise ValueError(f"некоректний telegram_id: {user['telegram_id']}")
+    return user
+
+
+async def _upsert_batch(session, users, stats):
+    """Створення нових та оновлення змінених користувачів пакету за telegram_id"""
+    by_telegram_id = unique_by(users, 'telegram_id', stats)
+
+    # Нормалізовані назви закладів і посад пакету замінюються на id одним запитом на довідник
+    for field, (model, name_column, id_column) in LOOKUPS.items():
+        found = await lookup_ids(session, model, {user[field] for user in by_telegram_id.values()})
+        for user in by_telegram_id.values():
+            value = user.pop(field)
+            user[id_column], user[name_column] = found[name_key(value)]
+
+    result = await session.execute(
+        select(User.id, User.telegram_id, *(getattr(User, column) for column in USER_COLUMNS))
+        .filter(User.telegram_id.in_(list(by_telegram_id)))
+    )
+    existing = {row.telegram_id: row for row in result}
+
+    new, changed = [], []
+    for telegram_id, user in by_telegram_id.items():
+        row = existing.get(telegram_id)
+        if row is None:
+            new.append(user)
+        elif any(getattr(row, column) != user[column] for column in USER_COLUMNS):
+            changed.append(dict(user, uid=row.id))
+        else:
+            stats.unchanged += 1
+
+    if new:
+        await session.execute(insert(User), new)
+    if changed:
+        await session.execute(update(User).where(User.id == bindparam('uid')), changed)
+    stats.inserted += len(new)
+    stats.updated += len(changed)
+
+
+async def sync_users(rows, batch_size=IN_BATCH_SIZE, dry_run=False):
+    """Синхронізація довідника співробітників: пари (номер рядка, словник полів FIELDS)
+    пакетами, кожен в окремій транзакції
+
+    Користувачі з файлу створюються вже зареєстрованими (без покрокової реєстрації), у наявних
+    оновлюються ім'я, заклад і посада; бали та користувачі, відсутні у файлі, не змінюються.
+    """
+    stats = ImportStats()
+
+    async for session in get_session():
+        await backfill_directory(session, batch_size)
+        for batch in valid_batches(rows, validate_row, stats, batch_size):
+            await _upsert_batch(session, batch, stats)
+            if dry_run:
+                await session.rollback()
+            else:
+                await session.commit()
+
+    if not dry_run and (stats.inserted or stats.updated):
+        user_cache.clear()
+        # Запущений бот скине свій кеш користувачів і перезавантажить рейтинг
+        async for session in get_session():
+            await bump_version(session, USERS)
+            await session.commit()
+    return stats
+
+
+class DirectoryWatcher(VersionWatcher):
+    """Скидання кешу користувачів та on_change() після синхронізації співробітників,
+    зокрема з CLI в окремому процесі"""
+
+    description = "довідника співробітників"
+
+    def __init__(self, on_change):
+        super().__init__()
+        self.on_change = on_change
+        self._version = None
+
+    async def check(self):
+        """Перший виклик лише запам'ятовує поточну версію"""
+        async for session in get_session():
+            version = await get_version(session, USERS)
+        if version == self._version:
+            return False
+        first, self._version = self._version is None, version
+        if first:
+            return False
+        user_cache.clear()
+        await self.on_change()
+        return True
+
+
+async def _run(args):
+    await init_db()
+    try:
+        stats = await sync_users(read_rows(args.path, args.format), args.batch_size, args.dry_run)
+        print(f"Синхронізація {args.path}{' (перевірка)' if args.dry_run else ''}: {stats}")
+        for error in stats.errors:
+            print(f"  {error}")
+    finally:
+        await close_db()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Синхронізація довідника співробітників (CSV/JSONL)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    sync_parser = subparsers.add_parser(
+        'sync', help=f"створення та оновлення користувачів з файлу з полями {', '.join(FIELDS)}"
+    )
+    sync_parser.add_argument('path')
+    sync_parser.add_argument('--dry-run', action='store_true', help="лише перевірити файл, нічого не записуючи")
+    sync_parser.add_argument('--format', choices=('csv', 'jsonl'), help="за замовчуванням - за розширенням файлу")
+    sync_parser.add_argument('--batch-size', type=int, default=IN_BATCH_SIZE)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(_run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+import hmac
+import logging
+
+from aiohttp import web
+
+import config
+from game_sessions import game_sessions
+from metrics import registry
+from profiler import profiler
+
+logger = logging.getLogger(__name__)
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': config.WEB_ALLOW_ORIGIN,
+    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type',
+    'Access-Control-Max-Age': '86400',
+}
+
+
+@web.middleware
+async def cors_middleware(request, handler):
+    # WebApp відкривається з іншого домену (GitHub Pages), тому потрібен CORS
+    if request.method == 'OPTIONS':
+        return web.Response(headers=CORS_HEADERS)
+    try:
+        response = await handler(request)
+    except web.HTTPException as e:
+        e.headers.update(CORS_HEADERS)
+        raise
+    response.headers.update(CORS_HEADERS)
+    return response
+
+
+async def get_game(request):
+    """Питання гри за токеном сесії"""
+    session = game_sessions.get(request.match_info['token'])
+    if session is None:
+        raise web.HTTPNotFound(text='Сесію гри не знайдено або її час вичерпано')
+
+    headers = {
+        'Content-Type': 'application/json; charset=utf-8',
+        'Cache-Control': f'private, max-age={game_sessions.ttl}',
+        'Vary': 'Accept-Encoding',
+    }
+    # Стиснутий варіант кешується в сесії і не перераховується на кожен запит
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        headers['Content-Encoding'] = 'gzip'
+        return web.Response(body=session.payload_gz, headers=headers)
+    return web.Response(body=session.payload, headers=headers)
+
+
+async def check_answer(request):
+    """Перевірка відповіді на питання гри"""
+    session = game_sessions.get(request.match_info['token'])
+    if session is None:
+        raise web.HTTPNotFound(text='Сесію гри не знайдено або її час вичерпано')
+
+    try:
+        data = await request.json()
+        index = int(data['question'])
+        option = int(data['option'])
+        if not 0 <= index < len(session.questions):
+            raise ValueError(index)
+    except (ValueError, KeyError, TypeError):
+        raise web.HTTPBadRequest(text='Некоректна відповідь')
+
+    return web.json_response(session.check(index, option))
+
+
+def _check_internal(request):
+    """Службові маршрути лише з токеном METRICS_TOKEN; без токена вони вимкнені
+
+    Адреса клієнта не перевіряється: за локальним зворотним проксі всі запити приходять з localhost.
+    """
+    if not config.METRICS_TOKEN:
+        raise web.HTTPNotFound()
+    expected = f'Bearer {config.METRICS_TOKEN}'
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), expected):
+        raise web.HTTPForbidden()
+
+
+async def get_metrics(request):
+    """Метрики у текстовому форматі Prometheus"""
+    _check_internal(request)
+    return web.Response(text=registry.render(), content_type='text/plain', charset='utf-8')
+
+
+async def start_profiler(request):
+    """Увімкнення семплювального профайлера циклу подій (?interval=секунди)"""
+    _check_internal(request)
+    try:
+        interval = float(request.query.get('interval', 0.005))
+    except ValueError:
+        raise web.HTTPBadRequest(text='Некоректний інтервал')
+    started = profiler.start(max(interval, 0.001))
+    return web.Response(text='started\n' if started else 'already running\n')
+
+
+async def stop_profiler(request):
+    """Зупинка профайлера; відповідь - стеки у форматі collapsed для flamegraph"""
+    _check_internal(request)
+    return web.Response(text=profiler.stop(), content_type='text/plain', charset='utf-8')
+
+
+def create_app():
+    app = web.Application(middlewares=[cors_middleware])
+    app.router.add_get('/game/{token}', get_game)
+    app.router.add_post('/game/{token}/answer', check_answer)
+    app.router.add_get('/metrics', get_metrics)
+    app.router.add_post('/debug/profiler/start', start_profiler)
+    app.router.add_post('/debug/profiler/stop', stop_profiler)
+    return app
+
+
+async def start_web_server(app=None, host=None, port=None):
+    """Запуск HTTP-сервера на поточному циклі подій; повертає runner для зупинки"""
+    runner = web.AppRunner(app or create_app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host or config.WEB_HOST, port or config.WEB_PORT)
+    await site.start()
+    logger.info(f"HTTP-сервер запущено на {site.name}")
+    return runner
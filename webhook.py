@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import signal
+
+from aiohttp import web
+from telegram import Update
+
+import config
+from metrics import update_queue_depth
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateDispatcher:
+    """Обмежена черга оновлень з пулом обробників
+
+    Коли черга заповнена, вебхук відповідає 503 і Telegram повторює доставку
+    пізніше, тому пікове навантаження не накопичується в пам'яті без меж.
+    """
+
+    def __init__(self, application, workers=8, maxsize=1000, put_timeout=1.0):
+        self.application = application
+        self.workers = workers
+        self.put_timeout = put_timeout
+        self.maxsize = maxsize
+        self._queue = None
+        self._tasks = []
+        self._closed = False
+
+    def __len__(self):
+        return self._queue.qsize() if self._queue else 0
+
+    def start(self):
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._closed = False
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def submit(self, data):
+        """Постановка оновлення в чергу; False, якщо черга закрита або переповнена"""
+        if self._closed or self._queue is None:
+            return False
+        update = Update.de_json(data, self.application.bot)
+        try:
+            await asyncio.wait_for(self._queue.put(update), self.put_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Черга оновлень переповнена")
+            return False
+        update_queue_depth.set(self._queue.qsize())
+        return True
+
+    async def _worker(self):
+        while True:
+            update = await self._queue.get()
+            update_queue_depth.set(self._queue.qsize())
+            try:
+                await self.application.process_update(update)
+            except Exception as e:
+                logger.error(f"Помилка при обробці оновлення {update.update_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def drain(self, timeout=30):
+        """Припинення прийому та обробка вже отриманих оновлень"""
+        self._closed = True
+        if self._queue is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Не оброблено оновлень при зупинці: {self._queue.qsize()}")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def handle(self, request):
+        """HTTP-обробник вебхука Telegram"""
+        if config.WEBHOOK_SECRET and \
+                request.headers.get('X-Telegram-Bot-Api-Secret-Token') != config.WEBHOOK_SECRET:
+            raise web.HTTPForbidden()
+        try:
+            data = await request.json()
+        except ValueError:
+            raise web.HTTPBadRequest()
+        if not await self.submit(data):
+            raise web.HTTPServiceUnavailable()
+        return web.Response()
+
+    def setup(self, app):
+        app.router.add_post(config.WEBHOOK_PATH, self.handle)
+
+
+async def _serve(application, allowed_updates):
+    dispatcher = UpdateDispatcher(
+        application,
+        workers=config.UPDATE_WORKERS,
+        maxsize=config.UPDATE_QUEUE_SIZE
+    )
+    # post_init підключає маршрут вебхука до HTTP-сервера, якщо диспетчер є
+    application.bot_data['update_dispatcher'] = dispatcher
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        dispatcher.start()
+
+        if config.WEBHOOK_URL:
+            await application.bot.set_webhook(
+                url=config.WEBHOOK_URL,
+                allowed_updates=allowed_updates,
+                secret_token=config.WEBHOOK_SECRET or None,
+                max_connections=config.WEBHOOK_MAX_CONNECTIONS
+            )
+        logger.info(f"Бот працює у режимі вебхука ({config.UPDATE_WORKERS} обробників)")
+        await stop.wait()
+
+        # Спершу перестаємо приймати запити, потім доробляємо чергу
+        web_runner = application.bot_data.pop('web_runner', None)
+        if web_runner:
+            await web_runner.cleanup()
+        await dispatcher.drain(config.SHUTDOWN_TIMEOUT)
+        await application.stop()
+    finally:
+        # Як і в run_polling: shutdown зберігає стан розмов, потім post_shutdown закриває базу
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+def run_webhook(application, allowed_updates):
+    """Запуск бота у режимі вебхука на поточному циклі подій"""
+    asyncio.get_event_loop().run_until_complete(_serve(application, allowed_updates))